@@ -4,6 +4,8 @@ import os
 import re
 # 用于JSON数据的序列化和反序列化
 import json
+# 用于在线程中执行同步的数据库操作，避免阻塞事件循环
+import asyncio
 # 用于定义异步上下文管理器
 from contextlib import asynccontextmanager
 # 用于类型提示，定义列表和可选参数
@@ -29,16 +31,27 @@ from pydantic import BaseModel, Field
 # 从自定义的库中引入函数
 from ragAgent import (
     ToolConfig,
-    create_graph,
+    create_async_graph,
     save_graph_visualization,
     get_llm,
     get_tools,
     Config,
     ConnectionPool,
+    AsyncConnectionPool,
     ConnectionPoolError,
     monitor_connection_pool,
+    is_memory_command,
 )
+from langchain_core.messages import AIMessage, HumanMessage
 from utils.user_management import create_tables, init_user_management
+from utils.semantic_cache import SemanticAnswerCache
+from utils.pgvector_store import PGCorpusVersion, get_connection_pool, close_connection_pools
+from utils.corpus_version import FileCorpusVersion
+
+
+# Windows下psycopg的异步连接需要使用SelectorEventLoop
+if sys.platform == "win32":
+    asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
 
 
 # 设置LangSmith环境变量 进行应用跟踪，实时了解应用中的每一步发生了什么
@@ -149,10 +162,11 @@ async def lifespan(app: FastAPI):
         ConnectionPoolError: 数据库连接池初始化或操作失败时抛出。
         Exception: 其他未预期的异常。
     """
-    # 声明全局变量 graph 和 tool_config
-    global graph, tool_config
-    # 初始化数据库连接池为 None
+    # 声明全局变量 graph、tool_config 和 semantic_cache
+    global graph, tool_config, semantic_cache
+    # 初始化数据库连接池为 None：同步连接池用于用户管理及语义答案缓存，异步连接池用于状态图的检查点和存储
     db_connection_pool = None
+    graph_connection_pool = None
     try:
         # 调用 get_llm 初始化聊天模型和嵌入模型
         llm_chat, llm_embedding = get_llm(Config.LLM_TYPE)
@@ -174,10 +188,21 @@ async def lifespan(app: FastAPI):
             timeout=10
         )
 
+        # 创建状态图使用的异步数据库连接池，参数与同步连接池一致
+        graph_connection_pool = AsyncConnectionPool(
+            conninfo=Config.DB_URI,
+            max_size=20,
+            min_size=2,
+            kwargs=connection_kwargs,
+            timeout=10,
+            open=False
+        )
+
         # 尝试打开数据库连接池
         try:
             # 打开连接池以启用数据库连接
             db_connection_pool.open()
+            await graph_connection_pool.open()
             # 记录连接池初始化成功的日志（INFO 级别）
             logger.info("Database connection pool initialized")
             # 记录详细调试日志（DEBUG 级别）
@@ -196,11 +221,12 @@ async def lifespan(app: FastAPI):
 
         # 启动连接池监控线程，60秒检查一次，设置为守护线程
         monitor_thread = monitor_connection_pool(db_connection_pool, interval=60)
+        graph_monitor_thread = monitor_connection_pool(graph_connection_pool, interval=60)
 
         # 尝试创建状态图
         try:
-            # 使用数据库连接池和模型创建状态图
-            graph = create_graph(db_connection_pool, llm_chat, llm_embedding, tool_config)
+            # 使用异步数据库连接池和模型创建异步状态图
+            graph = await create_async_graph(graph_connection_pool, llm_chat, llm_embedding, tool_config)
         except ConnectionPoolError as e:
             # 记录状态图创建失败的错误日志
             logger.error(f"Graph creation failed: {e}")
@@ -210,6 +236,29 @@ async def lifespan(app: FastAPI):
         # 保存状态图的可视化表示
         save_graph_visualization(graph)
 
+        # 初始化语义答案缓存，pgvector扩展不可用等情况下关闭缓存，不影响正常问答
+        semantic_cache = None
+        if Config.SEMANTIC_CACHE_ENABLED:
+            try:
+                # 知识库版本号与向量库存储在一起，pgvector后端时各服务实例读取同一数据库中的版本号
+                if Config.RETRIEVER_BACKEND == "pgvector":
+                    corpus_version = PGCorpusVersion(get_connection_pool(Config.PGVECTOR_DB_URI), Config.CHROMADB_COLLECTION_NAME)
+                else:
+                    corpus_version = FileCorpusVersion(Config.CORPUS_VERSION_PATH)
+                semantic_cache = SemanticAnswerCache(
+                    db_connection_pool,
+                    llm_embedding,
+                    corpus_version,
+                    dims=Config.SEMANTIC_CACHE_DIMS,
+                    threshold=Config.SEMANTIC_CACHE_THRESHOLD,
+                    ttl=Config.SEMANTIC_CACHE_TTL,
+                    max_entries_per_user=Config.SEMANTIC_CACHE_MAX_ENTRIES_PER_USER
+                )
+                semantic_cache.setup()
+            except Exception as e:
+                logger.warning(f"Semantic answer cache disabled: {e}")
+                semantic_cache = None
+
     except ConnectionPoolError as e:
         # 捕获并记录连接池相关异常
         logger.error(f"Connection pool error: {e}")
@@ -223,21 +272,156 @@ async def lifespan(app: FastAPI):
 
     # yield 表示应用运行期间，初始化完成后进入运行状态
     yield
+    # 关闭状态图使用的异步连接池
+    if graph_connection_pool and not graph_connection_pool.closed:
+        await graph_connection_pool.close()
+        logger.info("Graph connection pool closed")
     # 检查并关闭数据库连接池（清理资源）
     if db_connection_pool and not db_connection_pool.closed:
         # 关闭连接池
         db_connection_pool.close()
         # 记录连接池关闭的日志
         logger.info("Database connection pool closed")
+    # 关闭检索工具使用的pgvector连接池
+    close_connection_pools()
     # 记录服务关闭的日志
     logger.info("The service has been shut down")
 
 # 创建FastAPI实例 lifespan参数用于在应用程序生命周期的开始和结束时执行一些初始化或清理工作
 app = FastAPI(lifespan=lifespan)
+# 语义答案缓存，在 lifespan 中初始化
+semantic_cache = None
+
+
+# 判断本轮问答能否使用语义答案缓存：缓存按用户隔离、不区分会话，
+# 因此记忆指令（需由agent节点写入记忆）及已有会话记录的追问（答案依赖上下文）不使用缓存
+async def can_use_semantic_cache(semantic_cache, graph, config, user_input):
+    """
+    判断本轮问答能否查询及写入语义答案缓存。
+
+    Args:
+        semantic_cache: 语义答案缓存实例，为 None 表示未启用。
+        graph: 图对象，用于读取会话记录。
+        config (dict): 配置参数，包含线程和用户标识。
+        user_input (str): 用户输入的内容。
+
+    Returns:
+        bool: 缓存已启用、不是记忆指令且会话中尚无记录时返回 True。
+    """
+    if semantic_cache is None or not config["configurable"].get("user_id") or is_memory_command(user_input):
+        return False
+    try:
+        state = await graph.aget_state(config)
+        return not state.values.get("messages")
+    except Exception as e:
+        logger.error(f"Failed to read thread state for semantic cache: {e}")
+        return False
+
+
+# 命中语义答案缓存时，将本轮问答写入会话记录，后续追问可以获取上下文
+async def record_cached_turn(graph, config, user_input, answer):
+    """
+    将命中缓存的本轮问答写入会话记录（作为 generate 节点的输出，状态图随即结束）。
+
+    Args:
+        graph: 图对象。
+        config (dict): 配置参数，包含线程和用户标识。
+        user_input (str): 用户输入的内容。
+        answer (str): 缓存的答案。
+    """
+    try:
+        await graph.aupdate_state(config, {"messages": [HumanMessage(content=user_input), AIMessage(content=answer)]}, as_node="generate")
+    except Exception as e:
+        logger.error(f"Failed to record cached turn in thread state: {e}")
+
+
+# 查询语义答案缓存，未启用、未命中或查询失败时返回None
+def lookup_semantic_cache(semantic_cache, user_id, user_input):
+    """
+    查询语义答案缓存。
+
+    Args:
+        semantic_cache: 语义答案缓存实例，为 None 表示未启用。
+        user_id (str): 用户ID，缓存按用户隔离，未提供用户ID时不使用缓存。
+        user_input (str): 用户输入的内容。
+
+    Returns:
+        str: 命中时返回缓存的答案，否则返回 None。
+    """
+    if semantic_cache is None or not user_id:
+        return None
+    try:
+        return semantic_cache.lookup(user_id, user_input)
+    except Exception as e:
+        logger.error(f"Semantic cache lookup failed: {e}")
+        return None
+
+
+# 将本次问答写入语义答案缓存，写入失败只记录日志
+def store_semantic_cache(semantic_cache, config, user_input, answer):
+    """
+    将本次问答写入语义答案缓存。
+
+    Args:
+        semantic_cache: 语义答案缓存实例，为 None 表示未启用。
+        config (dict): 配置参数，包含线程和用户标识。
+        user_input (str): 用户输入的内容。
+        answer (str): 大模型生成的答案（未格式化）。
+    """
+    user_id = config["configurable"].get("user_id")
+    if semantic_cache is None or not user_id or not answer:
+        return
+    try:
+        semantic_cache.store(user_id, user_input, answer)
+    except Exception as e:
+        logger.error(f"Semantic cache store failed: {e}")
+
+
+# 命中语义答案缓存时，按非流式格式返回缓存的答案
+def cached_non_stream_response(answer):
+    """
+    命中语义答案缓存时，按非流式格式返回缓存的答案。
+
+    Args:
+        answer (str): 缓存的答案。
+
+    Returns:
+        JSONResponse: 包含格式化响应的 JSON 响应对象。
+    """
+    response = ChatCompletionResponse(
+        choices=[
+            ChatCompletionResponseChoice(
+                index=0,
+                message=Message(role="assistant", content=str(format_response(answer))),
+                finish_reason="stop"
+            )
+        ]
+    )
+    logger.info(f"Send cached response content: \n{response}")
+    return JSONResponse(content=response.model_dump())
+
+
+# 命中语义答案缓存时，按流式格式返回缓存的答案
+def cached_stream_response(answer):
+    """
+    命中语义答案缓存时，按流式格式返回缓存的答案：一个内容数据块加流结束标记。
+
+    Args:
+        answer (str): 缓存的答案。
+
+    Returns:
+        StreamingResponse: 流式响应对象，媒体类型为 text/event-stream。
+    """
+    async def generate_stream():
+        chunk_id = f"chatcmpl-{uuid.uuid4().hex}"
+        yield f"data: {json.dumps({'id': chunk_id, 'object': 'chat.completion.chunk', 'created': int(time.time()), 'choices': [{'index': 0, 'delta': {'content': answer}, 'finish_reason': None}]})}\n\n"
+        yield f"data: {json.dumps({'id': chunk_id, 'object': 'chat.completion.chunk', 'created': int(time.time()), 'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]})}\n\n"
+
+    return StreamingResponse(generate_stream(), media_type="text/event-stream")
 
 
 # 处理非流式响应的异步函数，生成并返回完整的响应内容
-async def handle_non_stream_response(user_input, graph, tool_config, config):
+async def handle_non_stream_response(user_input, graph, tool_config, config, semantic_cache=None):
     """
     处理非流式响应的异步函数，生成并返回完整的响应内容。
 
@@ -246,19 +430,24 @@ async def handle_non_stream_response(user_input, graph, tool_config, config):
         graph: 图对象，用于处理消息流。
         tool_config: 工具配置对象，包含可用工具的名称和定义。
         config (dict): 配置参数，包含线程和用户标识。
+        semantic_cache: 语义答案缓存实例，generate 节点成功生成答案后写入缓存，为 None 表示不写入。
 
     Returns:
         JSONResponse: 包含格式化响应的 JSON 响应对象。
     """
     # 初始化 content 变量，用于存储最终响应内容
     content = None
+    # generate 节点基于检索结果生成的答案，只有该答案写入语义答案缓存（agent 直接回复及出错提示不写入）
+    answer = None
+    # 是否完整地处理了事件流，出错时不写入语义答案缓存
+    completed = False
     try:
-        # 启动 graph.stream 处理用户输入，生成事件流
-        events = graph.stream({"messages": [{"role": "user", "content": user_input}], "rewrite_count": 0}, config)
+        # 启动 graph.astream 处理用户输入，生成事件流，等待大模型响应期间不阻塞事件循环
+        events = graph.astream({"messages": [{"role": "user", "content": user_input}], "rewrite_count": 0}, config)
         # 遍历事件流中的每个事件
-        for event in events:
-            # 遍历事件中的所有值
-            for value in event.values():
+        async for event in events:
+            # 遍历事件中的所有节点及其输出
+            for node_name, value in event.items():
                 # 检查事件值是否包含有效消息列表
                 if "messages" not in value or not isinstance(value["messages"], list):
                     # 记录警告日志，跳过无效消息
@@ -294,9 +483,11 @@ async def handle_non_stream_response(user_input, graph, tool_config, config):
                     else:
                         # 记录最终响应日志
                         logger.info(f"Final Response is: {content}")
+                        answer = content if node_name == "generate" and isinstance(last_message, AIMessage) else None
                 else:
                     # 记录无内容的消息日志，跳过处理
                     logger.info("Message has no content, skipping")
+        completed = True
     except ValueError as ve:
         # 捕获并记录值错误
         logger.error(f"Value error in response processing: {ve}")
@@ -304,6 +495,10 @@ async def handle_non_stream_response(user_input, graph, tool_config, config):
         # 捕获并记录其他未预期的异常
         logger.error(f"Error processing response: {e}")
 
+    # 写入语义答案缓存
+    if completed and answer and answer == content:
+        await asyncio.to_thread(store_semantic_cache, semantic_cache, config, user_input, answer)
+
     # 格式化响应内容，若无内容则返回默认值
     formatted_response = str(format_response(content)) if content else "No response generated"
     # 记录格式化后的响应日志
@@ -341,7 +536,7 @@ async def handle_non_stream_response(user_input, graph, tool_config, config):
 
 
 # 处理流式响应的异步函数，生成并返回流式数据
-async def handle_stream_response(user_input, graph, config):
+async def handle_stream_response(user_input, graph, config, semantic_cache=None):
     """
     处理流式响应的异步函数，生成并返回流式数据。
 
@@ -349,6 +544,7 @@ async def handle_stream_response(user_input, graph, config):
         user_input (str): 用户输入的内容。
         graph: 图对象，用于处理消息流。
         config (dict): 配置参数，包含线程和用户标识。
+        semantic_cache: 语义答案缓存实例，流正常结束后写入 generate 节点生成的答案，为 None 表示不写入。
 
     Returns:
         StreamingResponse: 流式响应对象，媒体类型为 text/event-stream。
@@ -366,14 +562,18 @@ async def handle_stream_response(user_input, graph, config):
         try:
             # 生成唯一的 chunk ID
             chunk_id = f"chatcmpl-{uuid.uuid4().hex}"
-            # 调用 graph.stream 获取消息流
-            stream_data = graph.stream(
+            # 调用 graph.astream 获取消息流
+            stream_data = graph.astream(
                 {"messages": [{"role": "user", "content": user_input}], "rewrite_count": 0},
                 config,
                 stream_mode="messages"
             )
+            # generate 节点最后一条流式输出的消息ID及其内容片段，流结束后作为答案写入语义答案缓存
+            # agent 节点的直接回复未经检索，不写入缓存
+            answer_id = None
+            answer_parts = []
             # 遍历消息流中的每个数据块
-            for message_chunk, metadata in stream_data:
+            async for message_chunk, metadata in stream_data:
                 try:
                     # 获取当前节点名称
                     node_name = metadata.get("langgraph_node") if metadata else None
@@ -381,6 +581,11 @@ async def handle_stream_response(user_input, graph, config):
                     if node_name in ["generate", "agent"]:
                         # 获取消息内容，默认空字符串
                         chunk = getattr(message_chunk, 'content', '')
+                        if chunk and node_name == "generate" and isinstance(message_chunk, AIMessage):
+                            if getattr(message_chunk, 'id', None) != answer_id:
+                                answer_id = getattr(message_chunk, 'id', None)
+                                answer_parts = []
+                            answer_parts.append(chunk)
                         # 记录流式数据块日志
                         logger.info(f"Streaming chunk from {node_name}: {chunk}")
                         # 产出流式数据块
@@ -390,6 +595,9 @@ async def handle_stream_response(user_input, graph, config):
                     logger.error(f"Error processing stream chunk: {chunk_error}")
                     continue
 
+            # 写入语义答案缓存
+            await asyncio.to_thread(store_semantic_cache, semantic_cache, config, user_input, ''.join(answer_parts))
+
             # 产出流结束标记
             yield f"data: {json.dumps({'id': chunk_id, 'object': 'chat.completion.chunk', 'created': int(time.time()), 'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]})}\n\n"
         except Exception as stream_error:
@@ -445,11 +653,22 @@ async def chat_completions(request: ChatCompletionRequest, dependencies: Tuple[a
             }
         }
 
+        # 查询语义答案缓存，命中时直接返回缓存的答案，不经过状态图（本轮问答仍写入会话记录）
+        # 记忆指令及已有会话记录的追问不使用缓存
+        use_cache = await can_use_semantic_cache(semantic_cache, graph, config, user_input)
+        if use_cache:
+            cached_answer = await asyncio.to_thread(lookup_semantic_cache, semantic_cache, request.userId, user_input)
+            if cached_answer is not None:
+                await record_cached_turn(graph, config, user_input, cached_answer)
+                if request.stream:
+                    return cached_stream_response(cached_answer)
+                return cached_non_stream_response(cached_answer)
+
         # 调用流式输出
         if request.stream:
-            return await handle_stream_response(user_input, graph, config)
+            return await handle_stream_response(user_input, graph, config, semantic_cache if use_cache else None)
         # 调用非流式输出
-        return await handle_non_stream_response(user_input, graph, tool_config, config)
+        return await handle_non_stream_response(user_input, graph, tool_config, config, semantic_cache if use_cache else None)
 
     except Exception as e:
         logger.error(f"Error handling chat completion:\n\n {str(e)}")
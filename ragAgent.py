@@ -9,10 +9,11 @@ import threading
 import time
 # 导入UUID模块，用于生成唯一标识符
 import uuid
+import inspect
 # 从html模块导入escape函数，用于转义HTML特殊字符
 from html import escape
 # 从typing模块导入类型提示工具
-from typing import Literal, Annotated, Sequence, Optional
+from typing import Literal, Annotated, Sequence, Optional, List
 # 从typing_extensions导入TypedDict，用于定义类型化的字典
 from typing_extensions import TypedDict
 # 导入LangChain的提示模板类
@@ -23,23 +24,27 @@ from langchain_core.messages import BaseMessage
 from langgraph.graph.message import add_messages
 # 导入预构建的工具条件和工具节点
 from langgraph.prebuilt import tools_condition, ToolNode
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from langchain_core.messages import ToolMessage
+from langchain_core.messages import ToolMessage, AIMessage, RemoveMessage
+# 导入文档类，检索工具以artifact形式返回逐条文档
+from langchain_core.documents import Document
 # 导入状态图和起始/结束节点的定义
 from langgraph.graph import StateGraph, START, END
 # 导入基础存储接口
 from langgraph.store.base import BaseStore
 # 导入可运行配置类
 from langchain_core.runnables import RunnableConfig
-# 导入Postgres存储类
+from langchain_core.runnables.config import patch_config
+# 导入Postgres存储类（同步及异步）
 from langgraph.store.postgres import PostgresStore
+from langgraph.store.postgres.aio import AsyncPostgresStore
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
 # 导入 psycopg 的操作异常类，用于捕获数据库连接错误
 from psycopg import OperationalError
-# 导入Postgres检查点保存类
+# 导入Postgres检查点保存类（同步及异步）
 from langgraph.checkpoint.postgres import PostgresSaver
-# 导入PostgreSQL连接池类
-from psycopg_pool import ConnectionPool
+from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+# 导入PostgreSQL连接池类（同步及异步）
+from psycopg_pool import ConnectionPool, AsyncConnectionPool
 # 导入Pydantic的基类和字段定义工具
 from pydantic import BaseModel, Field
 # 导入自定义的get_llm函数，用于获取LLM模型
@@ -48,6 +53,11 @@ from utils.llms import get_llm
 from utils.tools_config import get_tools
 # 导入统一的 Config 类
 from utils.config import Config
+# 导入相关性评分快速通道
+from utils.grade_gate import RelevanceGate
+# 导入多查询检索结果的融合及上下文处理函数
+from utils.retrievers import fuse_documents, apply_token_budget
+from utils.context_merge import deduplicate_context
 
 # # 设置日志基本配置，级别为DEBUG或INFO
 logger = logging.getLogger(__name__)
@@ -141,6 +151,11 @@ class DocumentRelevanceScore(BaseModel):
     # 定义binary_score字段，表示相关性评分，取值为"yes"或"no"
     binary_score: str = Field(description="Relevance score 'yes' or 'no'")
 
+# 多查询检索的改写查询列表
+class QueryVariants(BaseModel):
+    # 定义queries字段，表示从不同角度改写的检索查询
+    queries: List[str] = Field(description="Rewritten search queries")
+
 # 自定义异常，表示数据库连接池初始化或状态异常
 class ConnectionPoolError(Exception):
     """自定义异常，表示数据库连接池初始化或状态异常"""
@@ -148,6 +163,13 @@ class ConnectionPoolError(Exception):
 
 # 重定义ToolNode，支持并发处理工具调用
 class ParallelToolNode(ToolNode):
+    """并行执行工具调用的工具节点。
+
+    ToolNode本身已经并行执行同一条消息中的多个工具调用（同步路径走线程池，
+    异步路径走asyncio.gather），并保留content_and_artifact工具返回的artifact，
+    这里只在同步路径上用max_workers限制线程池的并发数。
+    """
+
     # 初始化方法，继承自ToolNode，接收工具列表和最大线程数参数
     def __init__(self, tools, max_workers: int = 5):
         # 调用父类ToolNode的初始化方法，传入工具列表
@@ -155,88 +177,10 @@ class ParallelToolNode(ToolNode):
         # 设置实例变量max_workers，定义线程池的最大工作线程数，默认为5
         self.max_workers = max_workers  # 线程池最大工作线程数
 
-    # 定义私有方法，用于执行单个工具调用，返回ToolMessage对象
-    def _run_single_tool(self, tool_call: dict, tool_map: dict) -> ToolMessage:
-        """执行单个工具调用"""
-        # 使用try-except块捕获工具执行中的异常
-        try:
-            # 从tool_call字典中提取工具名称
-            tool_name = tool_call["name"]
-            # 从tool_map中获取对应的工具实例，若不存在则返回None
-            tool = tool_map.get(tool_name)
-            # 检查工具是否存在，若不存在则抛出ValueError异常
-            if not tool:
-                raise ValueError(f"Tool {tool_name} not found")
-            # 调用工具的invoke方法，传入工具参数，执行工具逻辑
-            result = tool.invoke(tool_call["args"])
-            # 创建并返回ToolMessage对象，包含工具执行结果、调用ID和工具名称
-            return ToolMessage(
-                content=str(result),
-                tool_call_id=tool_call["id"],
-                name=tool_name
-            )
-        # 捕获所有异常，记录错误并返回包含错误信息的ToolMessage
-        except Exception as e:
-            # 记录工具执行失败的错误日志，包含工具名称和异常信息
-            logger.error(f"Error executing tool {tool_call.get('name', 'unknown')}: {e}")
-            # 返回包含错误内容的ToolMessage对象，用于状态更新
-            return ToolMessage(
-                content=f"Error: {str(e)}",
-                tool_call_id=tool_call["id"],
-                name=tool_call.get("name", "unknown")
-            )
-
-    # 定义可调用方法，使实例可直接调用，实现并行执行所有工具调用
-    def __call__(self, state: dict) -> dict:
-        """并行执行所有工具调用"""
-        # 记录日志，表示开始处理工具调用
-        logger.info("ParallelToolNode processing tool calls")
-        # 从状态字典中获取最后一条消息
-        last_message = state["messages"][-1]
-        # 获取最后一条消息中的工具调用列表，若不存在则返回空列表
-        tool_calls = getattr(last_message, "tool_calls", [])
-        # 检查工具调用列表是否为空，若为空则记录警告并返回空消息列表
-        if not tool_calls:
-            logger.warning("No tool calls found in state")
-            return {"messages": []}
-
-        # 创建工具名称到工具实例的映射字典，便于快速查找
-        tool_map = {tool.name: tool for tool in self.tools}
-        # 初始化结果列表，用于存储所有工具调用的返回消息
-        results = []
-
-        # 使用线程池管理并行任务，max_workers控制最大并发线程数
-        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            # 使用字典推导式提交所有工具调用任务到线程池，返回future到tool_call的映射
-            future_to_tool = {
-                executor.submit(self._run_single_tool, tool_call, tool_map): tool_call
-                for tool_call in tool_calls
-            }
-            # 遍历已完成的future对象，按完成顺序收集结果
-            for future in as_completed(future_to_tool):
-                # 使用try-except块捕获线程执行中的异常
-                try:
-                    # 获取future的结果，即工具调用的返回消息
-                    result = future.result()
-                    # 将结果添加到结果列表
-                    results.append(result)
-                # 捕获线程执行失败的异常，记录错误并添加错误消息到结果
-                except Exception as e:
-                    # 记录工具执行失败的错误日志，包含异常信息
-                    logger.error(f"Tool execution failed: {e}")
-                    # 获取失败任务对应的tool_call
-                    tool_call = future_to_tool[future]
-                    # 创建包含错误信息的ToolMessage并添加到结果列表
-                    results.append(ToolMessage(
-                        content=f"Unexpected error: {str(e)}",
-                        tool_call_id=tool_call["id"],
-                        name=tool_call.get("name", "unknown")
-                    ))
-
-        # 记录日志，表示完成所有工具调用，包含调用数量
-        logger.info(f"Completed {len(results)} tool calls")
-        # 返回更新后的状态字典，包含所有工具调用的结果消息
-        return {"messages": results}
+    def invoke(self, input, config: Optional[RunnableConfig] = None, **kwargs):
+        """同步执行工具调用，线程池并发数不超过max_workers。"""
+        config = patch_config(config, max_concurrency=self.max_workers)
+        return super().invoke(input, config, **kwargs)
 
 
 # 定义获取最新问题的辅助函数
@@ -278,6 +222,11 @@ def filter_messages(messages: list) -> list:
     return filtered[-5:] if len(filtered) > 5 else filtered
 
 
+# 判断用户输入是否为记忆指令（包含“记住”），记忆指令需经过agent节点写入跨线程存储
+def is_memory_command(text: str) -> bool:
+    return "记住" in str(text).lower()
+
+
 # 定义跨线程的持久化存储的存储和过滤函数
 def store_memory(question: BaseMessage, config: RunnableConfig, store: BaseStore) -> str:
     """存储用户输入中的记忆信息。
@@ -297,7 +246,7 @@ def store_memory(question: BaseMessage, config: RunnableConfig, store: BaseStore
         user_info = "\n".join([d.value["data"] for d in memories])
 
         # 如果包含“记住”，存储新记忆
-        if "记住" in question.content.lower():
+        if is_memory_command(question.content):
             memory = escape(question.content)
             store.put(namespace, str(uuid.uuid4()), {"data": memory})
             logger.info(f"Stored memory: {memory}")
@@ -308,6 +257,36 @@ def store_memory(question: BaseMessage, config: RunnableConfig, store: BaseStore
         return ""
 
 
+# 跨线程持久化存储的异步版本，供异步状态图使用
+async def astore_memory(question: BaseMessage, config: RunnableConfig, store: BaseStore) -> str:
+    """存储用户输入中的记忆信息（异步）。
+
+    Args:
+        question: 用户输入的消息。
+        config: 运行时配置。
+        store: 数据存储实例。
+
+    Returns:
+        str: 用户相关的记忆信息字符串。
+    """
+    namespace = ("memories", config["configurable"]["user_id"])
+    try:
+        # 在跨线程存储数据库中搜索相关记忆
+        memories = await store.asearch(namespace, query=str(question.content))
+        user_info = "\n".join([d.value["data"] for d in memories])
+
+        # 如果包含“记住”，存储新记忆
+        if is_memory_command(question.content):
+            memory = escape(question.content)
+            await store.aput(namespace, str(uuid.uuid4()), {"data": memory})
+            logger.info(f"Stored memory: {memory}")
+
+        return user_info
+    except Exception as e:
+        logger.error(f"Error in astore_memory: {e}")
+        return ""
+
+
 # 定义创建处理链的函数
 def create_chain(llm_chat, template_file: str, structured_output=None):
     """创建 LLM 处理链，加载提示模板并绑定模型，使用缓存避免重复读取文件。
@@ -368,9 +347,23 @@ def test_connection(db_connection_pool: ConnectionPool) -> bool:
     return True
 
 
+# 异步连接池的连接测试，重试机制同上
+@retry(stop=stop_after_attempt(3),wait=wait_exponential(multiplier=1, min=2, max=10),retry=retry_if_exception_type(OperationalError))
+async def atest_connection(db_connection_pool: AsyncConnectionPool) -> bool:
+    """测试异步连接池是否可用"""
+    async with db_connection_pool.connection() as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute("SELECT 1")
+            result = await cursor.fetchone()
+            if result != (1,):
+                raise ConnectionPoolError("连接池测试查询失败，返回结果异常")
+    return True
+
+
 # 周期性检查连接池状态，记录可用连接数和异常情况，提前预警
 def monitor_connection_pool(db_connection_pool: ConnectionPool, interval: int = 60):
     """周期性监控连接池状态"""
+    # 同步及异步连接池均可，get_stats()为同步方法
     def _monitor():
         while not db_connection_pool.closed:
             try:
@@ -436,12 +429,86 @@ def agent(state: MessagesState, config: RunnableConfig, *, store: BaseStore, llm
         return {"messages": [{"role": "system", "content": "处理请求时出错"}]}
 
 
+# 获取检索工具消息中逐条的文档（检索工具以content_and_artifact格式返回），没有时返回None
+def get_retrieved_documents(message: BaseMessage) -> Optional[list]:
+    artifact = getattr(message, "artifact", None)
+    if isinstance(artifact, list) and artifact and all(isinstance(doc, Document) for doc in artifact):
+        return artifact
+    return None
+
+
+# 将文档拼接为工具消息的内容，格式与检索工具的输出一致
+def format_documents(documents: list) -> str:
+    return "\n\n".join(doc.page_content for doc in documents)
+
+
+# 按配置创建相关性评分快速通道，未启用时返回None
+def create_relevance_gate() -> Optional[RelevanceGate]:
+    if not Config.GRADE_GATE_ENABLED:
+        return None
+    return RelevanceGate(
+        yes_score=Config.GRADE_GATE_YES_SCORE,
+        no_score=Config.GRADE_GATE_NO_SCORE,
+        lexical_yes=Config.GRADE_GATE_LEXICAL_YES,
+        lexical_no=Config.GRADE_GATE_LEXICAL_NO,
+        audit_rate=Config.GRADE_GATE_AUDIT_RATE
+    )
+
+
+# 快速通道先行判定各文档，返回 (各文档的判定，需要交给大模型评分的文档下标)
+# 处于模糊区间的文档，以及被抽中复核的已判定文档交给大模型评分
+def plan_document_grading(question: str, documents: list, gate: Optional[RelevanceGate]) -> tuple:
+    decisions = [gate.decide(question, doc) if gate else None for doc in documents]
+    llm_indices = [i for i, decision in enumerate(decisions) if decision is None or gate.should_audit()]
+    return decisions, llm_indices
+
+
+# 合并快速通道的判定与大模型的评分结果，复核的文档以快速通道的判定为准，只记录是否一致
+def combine_document_grades(decisions: list, llm_indices: list, llm_results: list, gate: Optional[RelevanceGate]) -> list:
+    results = [DocumentRelevanceScore(binary_score=decision) if decision else None for decision in decisions]
+    for i, result in zip(llm_indices, llm_results):
+        if decisions[i] is None:
+            results[i] = result
+        elif not isinstance(result, Exception):
+            gate.record_audit(decisions[i], str(result.binary_score))
+    if gate:
+        logger.info(f"Relevance gate: {len(decisions) - len(llm_indices)}/{len(decisions)} documents graded without LLM, "
+                    f"stats: {gate.stats()}")
+    return results
+
+
+# 根据逐条文档的评分结果更新状态：只保留评为相关的文档，以相同ID替换原工具消息，全部不相关时评分为"no"
+def apply_document_grades(message: ToolMessage, documents: list, results: list) -> dict:
+    relevant = []
+    for doc, result in zip(documents, results):
+        # 评分出错的文档保留，避免丢弃可能相关的内容
+        if isinstance(result, Exception):
+            logger.error(f"Error grading document: {result}")
+            relevant.append(doc)
+        elif str(result.binary_score).lower() == "yes":
+            relevant.append(doc)
+    logger.info(f"Per-document relevance: {len(relevant)}/{len(documents)} documents relevant")
+    if not relevant:
+        return {"relevance_score": "no"}
+    if len(relevant) == len(documents):
+        return {"relevance_score": "yes"}
+    filtered = ToolMessage(
+        content=format_documents(relevant),
+        artifact=relevant,
+        tool_call_id=message.tool_call_id,
+        name=message.name,
+        id=message.id
+    )
+    return {"messages": [filtered], "relevance_score": "yes"}
+
+
 # 定义 Node grade_documents相关性评估函数
-def grade_documents(state: MessagesState, llm_chat) -> dict:
+def grade_documents(state: MessagesState, llm_chat, gate: Optional[RelevanceGate] = None) -> dict:
     """评估检索到的文档内容与问题的相关性，并将评分结果存储在状态中。
 
     Args:
         state: 当前对话状态，包含消息历史。
+        gate: 相关性评分快速通道，明显相关或无关的文档不调用大模型评分。
 
     Returns:
         dict: 更新后的状态，包含评分结果。
@@ -463,6 +530,18 @@ def grade_documents(state: MessagesState, llm_chat) -> dict:
 
         # 创建评分处理链
         grade_chain = create_chain(llm_chat, Config.PROMPT_TEMPLATE_TXT_GRADE, DocumentRelevanceScore)
+
+        # 逐条文档并发评分，只保留相关的文档，全部不相关时才重写问题
+        documents = get_retrieved_documents(state["messages"][-1]) if Config.GRADE_PER_DOCUMENT else None
+        if documents:
+            decisions, llm_indices = plan_document_grading(question, documents, gate)
+            llm_results = grade_chain.batch(
+                [{"question": question, "context": documents[i].page_content} for i in llm_indices],
+                config={"max_concurrency": Config.GRADE_MAX_CONCURRENCY},
+                return_exceptions=True
+            ) if llm_indices else []
+            results = combine_document_grades(decisions, llm_indices, llm_results, gate)
+            return apply_document_grades(state["messages"][-1], documents, results)
         # 调用评分链评估相关性
         scored_result = grade_chain.invoke({"question": question, "context": context})
         # logger.info(f"scored_result:{scored_result}")
@@ -558,6 +637,276 @@ def generate(state: MessagesState, llm_chat) -> dict:
         return {"messages": [{"role": "system", "content": "无法生成回复"}]}
 
 
+# 异步节点函数，与上面的同步版本逻辑一致，调用大模型及存储时使用ainvoke等异步接口，不阻塞事件循环
+async def aagent(state: MessagesState, config: RunnableConfig, *, store: BaseStore, llm_chat, tool_config: ToolConfig) -> dict:
+    """代理函数（异步），根据用户问题决定是否调用工具或结束。
+
+    Args:
+        state: 当前对话状态。
+        config: 运行时配置。
+        store: 数据存储实例。
+        llm_chat: Chat模型。
+        tool_config: 工具配置参数。
+
+    Returns:
+        dict: 更新后的对话状态。
+    """
+    logger.info("Agent processing user query")
+    try:
+        # 获取最后一条消息即用户问题
+        question = state["messages"][-1]
+        logger.info(f"agent question:{question}")
+        # 跨线程持久化存储记忆并获取相关信息，线程内消息过滤
+        user_info = await astore_memory(question, config, store)
+        messages = filter_messages(state["messages"])
+        # 将工具绑定到 LLM 并创建代理处理链
+        agent_chain = create_chain(llm_chat.bind_tools(tool_config.get_tools()), Config.PROMPT_TEMPLATE_TXT_AGENT)
+        response = await agent_chain.ainvoke({"question": question, "messages": messages, "userInfo": user_info})
+        return {"messages": [response]}
+    except Exception as e:
+        logger.error(f"Error in agent processing: {e}")
+        return {"messages": [{"role": "system", "content": "处理请求时出错"}]}
+
+
+async def agrade_documents(state: MessagesState, llm_chat, gate: Optional[RelevanceGate] = None) -> dict:
+    """评估检索到的文档内容与问题的相关性（异步），并将评分结果存储在状态中。
+
+    Args:
+        state: 当前对话状态，包含消息历史。
+        gate: 相关性评分快速通道，明显相关或无关的文档不调用大模型评分。
+
+    Returns:
+        dict: 更新后的状态，包含评分结果。
+    """
+    logger.info("Grading documents for relevance")
+    if not state.get("messages"):
+        logger.error("Messages state is empty")
+        return {"messages": [{"role": "system", "content": "状态为空，无法评分"}], "relevance_score": None}
+    try:
+        question = get_latest_question(state)
+        context = state["messages"][-1].content
+        grade_chain = create_chain(llm_chat, Config.PROMPT_TEMPLATE_TXT_GRADE, DocumentRelevanceScore)
+        # 逐条文档并发评分，只保留相关的文档，全部不相关时才重写问题
+        documents = get_retrieved_documents(state["messages"][-1]) if Config.GRADE_PER_DOCUMENT else None
+        if documents:
+            decisions, llm_indices = plan_document_grading(question, documents, gate)
+            llm_results = await grade_chain.abatch(
+                [{"question": question, "context": documents[i].page_content} for i in llm_indices],
+                config={"max_concurrency": Config.GRADE_MAX_CONCURRENCY},
+                return_exceptions=True
+            ) if llm_indices else []
+            results = combine_document_grades(decisions, llm_indices, llm_results, gate)
+            return apply_document_grades(state["messages"][-1], documents, results)
+        scored_result = await grade_chain.ainvoke({"question": question, "context": context})
+        score = scored_result.binary_score
+        logger.info(f"Document relevance score: {score}")
+        return {"messages": state["messages"], "relevance_score": score}
+    except (IndexError, KeyError) as e:
+        logger.error(f"Message access error: {e}")
+        return {"messages": [{"role": "system", "content": "无法评分文档"}], "relevance_score": None}
+    except Exception as e:
+        logger.error(f"Unexpected error in grading: {e}")
+        return {"messages": [{"role": "system", "content": "评分过程中出错"}], "relevance_score": None}
+
+
+async def arewrite(state: MessagesState, llm_chat) -> dict:
+    """重写用户查询以改进问题（异步）。
+
+    Args:
+        state: 当前对话状态。
+
+    Returns:
+        dict: 更新后的消息状态。
+    """
+    logger.info("Rewriting query")
+    try:
+        question = get_latest_question(state)
+        rewrite_chain = create_chain(llm_chat, Config.PROMPT_TEMPLATE_TXT_REWRITE)
+        response = await rewrite_chain.ainvoke({"question": question})
+        rewrite_count = state.get("rewrite_count", 0) + 1
+        logger.info(f"Rewrite count: {rewrite_count}")
+        return {"messages": [response], "rewrite_count": rewrite_count}
+    except (IndexError, KeyError) as e:
+        logger.error(f"Message access error in rewrite: {e}")
+        return {"messages": [{"role": "system", "content": "无法重写查询"}]}
+
+
+async def agenerate(state: MessagesState, llm_chat) -> dict:
+    """基于工具返回的内容生成最终回复（异步）。
+
+    Args:
+        state: 当前对话状态。
+
+    Returns:
+        dict: 更新后的消息状态。
+    """
+    logger.info("Generating final response")
+    try:
+        question = get_latest_question(state)
+        context = state["messages"][-1].content
+        generate_chain = create_chain(llm_chat, Config.PROMPT_TEMPLATE_TXT_GENERATE)
+        response = await generate_chain.ainvoke({"context": context, "question": question})
+        return {"messages": [response]}
+    except (IndexError, KeyError) as e:
+        logger.error(f"Message access error in generate: {e}")
+        return {"messages": [{"role": "system", "content": "无法生成回复"}]}
+
+
+# 多查询检索：改写查询对应的工具调用ID后缀，融合结果时据此找到同一原始调用的各次检索结果
+MULTI_QUERY_ID_SUFFIX = "_mq"
+
+
+# 为消息中的第一个检索工具调用追加改写查询的工具调用，由工具节点并行执行
+def expand_tool_calls(message: AIMessage, call: dict, variants: list) -> AIMessage:
+    query = str(call["args"].get("query", "")).strip()
+    queries = []
+    for variant in variants:
+        variant = str(variant).strip()
+        if variant and variant != query and variant not in queries:
+            queries.append(variant)
+    extra_calls = [
+        {"name": call["name"], "args": {**call["args"], "query": variant}, "id": f"{call['id']}{MULTI_QUERY_ID_SUFFIX}{i}", "type": "tool_call"}
+        for i, variant in enumerate(queries[:Config.MULTI_QUERY_COUNT], start=1)
+    ]
+    logger.info(f"Multi-query expansion: {query} -> {[c['args']['query'] for c in extra_calls]}")
+    # 以相同ID替换原消息
+    return message.model_copy(update={"tool_calls": list(message.tool_calls) + extra_calls})
+
+
+# 获取需要改写扩展的检索工具调用，没有时返回None
+def get_retrieval_call(state: MessagesState, tool_config: ToolConfig) -> Optional[dict]:
+    last_message = state["messages"][-1]
+    for call in getattr(last_message, "tool_calls", None) or []:
+        if tool_config.get_tool_routing_config().get(call["name"].lower()) == "grade_documents" and \
+                MULTI_QUERY_ID_SUFFIX not in call["id"]:
+            return call
+    return None
+
+
+# 定义Node 多查询改写：一次大模型调用生成多个改写查询，作为额外的检索工具调用
+def expand_queries(state: MessagesState, llm_chat, tool_config: ToolConfig) -> dict:
+    """为检索工具调用生成多个改写查询，与原查询一起由工具节点并行检索。
+
+    Args:
+        state: 当前对话状态。
+        llm_chat: Chat模型。
+        tool_config: 工具配置参数。
+
+    Returns:
+        dict: 更新后的消息状态，改写失败或没有检索工具调用时不更新。
+    """
+    call = get_retrieval_call(state, tool_config)
+    if call is None:
+        return {}
+    try:
+        multi_query_chain = create_chain(llm_chat, Config.PROMPT_TEMPLATE_TXT_MULTI_QUERY, QueryVariants)
+        result = multi_query_chain.invoke({"question": get_latest_question(state), "query": call["args"].get("query", ""),
+                                           "count": Config.MULTI_QUERY_COUNT})
+        return {"messages": [expand_tool_calls(state["messages"][-1], call, result.queries)]}
+    except Exception as e:
+        logger.error(f"Error in multi-query expansion, using original query only: {e}")
+        return {}
+
+
+async def aexpand_queries(state: MessagesState, llm_chat, tool_config: ToolConfig) -> dict:
+    """为检索工具调用生成多个改写查询（异步），与原查询一起由工具节点并行检索。
+
+    Args:
+        state: 当前对话状态。
+        llm_chat: Chat模型。
+        tool_config: 工具配置参数。
+
+    Returns:
+        dict: 更新后的消息状态，改写失败或没有检索工具调用时不更新。
+    """
+    call = get_retrieval_call(state, tool_config)
+    if call is None:
+        return {}
+    try:
+        multi_query_chain = create_chain(llm_chat, Config.PROMPT_TEMPLATE_TXT_MULTI_QUERY, QueryVariants)
+        result = await multi_query_chain.ainvoke({"question": get_latest_question(state), "query": call["args"].get("query", ""),
+                                                  "count": Config.MULTI_QUERY_COUNT})
+        return {"messages": [expand_tool_calls(state["messages"][-1], call, result.queries)]}
+    except Exception as e:
+        logger.error(f"Error in multi-query expansion, using original query only: {e}")
+        return {}
+
+
+# 定义Node 多查询检索结果融合：将原查询及各改写查询的检索结果按RRF融合为一条工具消息
+def fuse_retrievals(state: MessagesState) -> dict:
+    """将同一检索工具调用的原查询及改写查询的检索结果按排名融合，替换原工具消息并删除改写查询的工具消息。
+
+    Args:
+        state: 当前对话状态。
+
+    Returns:
+        dict: 更新后的消息状态，没有改写查询的检索结果时不更新。
+    """
+    # 最后一条AI消息之后的工具消息即本轮工具调用的结果
+    tool_messages = []
+    ai_message = None
+    for message in reversed(state["messages"]):
+        if isinstance(message, ToolMessage):
+            tool_messages.insert(0, message)
+        else:
+            ai_message = message
+            break
+    variants = [m for m in tool_messages if MULTI_QUERY_ID_SUFFIX in m.tool_call_id]
+    if not variants or ai_message is None:
+        return {}
+    base_id = variants[0].tool_call_id.split(MULTI_QUERY_ID_SUFFIX)[0]
+    original = next((m for m in tool_messages if m.tool_call_id == base_id), None)
+    if original is None:
+        return {}
+    rankings = [docs for docs in (get_retrieved_documents(m) for m in [original] + variants) if docs]
+    documents = fuse_documents(rankings, Config.MULTI_QUERY_TOP_K, Config.RRF_K)
+    if Config.CONTEXT_DEDUP:
+        documents = deduplicate_context(documents, Config.CONTEXT_DEDUP_MIN_OVERLAP, Config.CONTEXT_DEDUP_MIN_SENTENCE_LENGTH)
+    documents, tokens = apply_token_budget(documents, Config.RETRIEVER_MAX_CONTEXT_TOKENS)
+    logger.info(f"Fused {len(rankings)} retrievals into {len(documents)} documents (~{tokens} tokens)")
+    fused = ToolMessage(
+        content=format_documents(documents),
+        artifact=documents,
+        tool_call_id=original.tool_call_id,
+        name=original.name,
+        id=original.id
+    )
+    # 原AI消息只保留原始的工具调用，工具调用与工具消息保持一一对应
+    restored = ai_message.model_copy(update={"tool_calls": [c for c in ai_message.tool_calls if MULTI_QUERY_ID_SUFFIX not in c["id"]]})
+    return {"messages": [restored, fused] + [RemoveMessage(id=m.id) for m in variants]}
+
+
+# 定义Node 重写后直接检索：以改写后的问题构造检索工具调用，跳过agent节点
+def retrieve_rewritten(state: MessagesState, tool_config: ToolConfig) -> dict:
+    """以rewrite节点改写后的问题构造检索工具调用，直接交给工具节点执行，省去agent节点的一次绑定工具的大模型调用。
+
+    检索工具及其他参数沿用最近一次的检索工具调用。
+
+    Args:
+        state: 当前对话状态，最后一条消息为改写后的问题。
+        tool_config: 工具配置参数。
+
+    Returns:
+        dict: 更新后的消息状态，改写结果为空或没有可沿用的检索工具调用时不更新（回到agent节点）。
+    """
+    query = str(state["messages"][-1].content).strip() if state.get("messages") else ""
+    routing = tool_config.get_tool_routing_config()
+    previous = None
+    for message in reversed(state.get("messages", [])):
+        calls = [c for c in getattr(message, "tool_calls", None) or []
+                 if routing.get(c["name"].lower()) == "grade_documents" and MULTI_QUERY_ID_SUFFIX not in c["id"]]
+        if calls:
+            previous = calls[0]
+            break
+    if not query or previous is None:
+        logger.warning("No rewritten query or previous retrieval call, falling back to agent")
+        return {}
+    logger.info(f"Retrieving directly with rewritten query: {query}")
+    return {"messages": [AIMessage(content="", tool_calls=[
+        {"name": previous["name"], "args": {**previous["args"], "query": query}, "id": f"call_{uuid.uuid4().hex}", "type": "tool_call"}
+    ])]}
+
+
 # 定义Edge 根据工具调用的结果动态决定下一步路由
 def route_after_tools(state: MessagesState, tool_config: ToolConfig) -> Literal["generate", "grade_documents"]:
     """
@@ -749,31 +1098,186 @@ def create_graph(db_connection_pool: ConnectionPool, llm_chat, llm_embedding, to
         logger.error(f"Failed to setup PostgresStore: {e}")
         raise ConnectionPoolError(f"存储初始化失败: {str(e)}")
 
+    # 相关性评分快速通道，计数在进程内累计
+    gate = create_relevance_gate()
+    # 创建状态图，各节点使用同步版本的节点函数
+    workflow = build_workflow({
+        "agent": lambda state, config: agent(state, config, store=store, llm_chat=llm_chat, tool_config=tool_config),
+        "rewrite": lambda state: rewrite(state, llm_chat=llm_chat),
+        "generate": lambda state: generate(state, llm_chat=llm_chat),
+        "grade_documents": lambda state: grade_documents(state, llm_chat=llm_chat, gate=gate),
+        "expand_queries": lambda state: expand_queries(state, llm_chat=llm_chat, tool_config=tool_config),
+    }, tool_config)
+
+    # 编译状态图，绑定检查点和存储
+    return workflow.compile(checkpointer=checkpointer, store=store)
+
+
+# 节点耗时日志包装，保持节点函数的同步/异步类型，原函数接收config参数时照常传入
+def timed_node(name: str, func):
+    """包装节点函数，记录每次执行的耗时。
+
+    Args:
+        name: 节点名称。
+        func: 节点函数（同步或异步）。
+
+    Returns:
+        Callable: 包装后的节点函数。
+    """
+    accepts_config = "config" in inspect.signature(func).parameters
+
+    def log_elapsed(start: float, config: RunnableConfig):
+        thread_id = config.get("configurable", {}).get("thread_id")
+        logger.info(f"Node {name} finished in {(time.perf_counter() - start) * 1000:.1f} ms (thread_id: {thread_id})")
+
+    if inspect.iscoroutinefunction(func):
+        async def wrapper(state, config: RunnableConfig):
+            start = time.perf_counter()
+            try:
+                return await (func(state, config) if accepts_config else func(state))
+            finally:
+                log_elapsed(start, config)
+    else:
+        def wrapper(state, config: RunnableConfig):
+            start = time.perf_counter()
+            try:
+                return func(state, config) if accepts_config else func(state)
+            finally:
+                log_elapsed(start, config)
+    return wrapper
+
+
+# 构建状态图（未编译），同步及异步版本共用同一拓扑，只有节点函数不同
+def build_workflow(nodes: dict, tool_config: ToolConfig) -> StateGraph:
+    """构建状态图的节点和边。
+
+    Args:
+        nodes: 节点名称到节点函数的映射，包含 agent、rewrite、generate、grade_documents，多查询检索策略下还包含 expand_queries。
+        tool_config: 工具配置参数。
+
+    Returns:
+        StateGraph: 未编译的状态图。
+    """
     # 创建状态图实例，使用MessagesState作为状态类型
     workflow = StateGraph(MessagesState)
+
+    # 添加节点，开启节点耗时日志时包装节点函数
+    def add_node(name: str, func):
+        workflow.add_node(name, timed_node(name, func) if Config.NODE_TIMING_LOG else func)
+
     # 添加代理节点
-    workflow.add_node("agent", lambda state, config: agent(state, config, store=store, llm_chat=llm_chat, tool_config=tool_config))
-    # 添加工具节点，使用并行工具节点
+    add_node("agent", nodes["agent"])
+    # 添加工具节点，使用并行工具节点（同步及异步调用均支持）
     workflow.add_node("call_tools", ParallelToolNode(tool_config.get_tools(), max_workers=5))
     # 添加重写节点
-    workflow.add_node("rewrite", lambda state: rewrite(state,llm_chat=llm_chat))
+    add_node("rewrite", nodes["rewrite"])
     # 添加生成节点
-    workflow.add_node("generate", lambda state: generate(state, llm_chat=llm_chat))
+    add_node("generate", nodes["generate"])
     # 添加文档相关性评分节点
-    workflow.add_node("grade_documents", lambda state: grade_documents(state, llm_chat=llm_chat))
+    add_node("grade_documents", nodes["grade_documents"])
+    # 多查询检索策略：工具节点之前生成改写查询，之后融合各次检索结果再评分
+    multi_query = Config.RETRIEVAL_STRATEGY == "multi_query"
+    tools_entry = "expand_queries" if multi_query else "call_tools"
+    if multi_query:
+        add_node("expand_queries", nodes["expand_queries"])
+        add_node("fuse_retrievals", fuse_retrievals)
+        workflow.add_edge(start_key="expand_queries", end_key="call_tools")
+        workflow.add_edge(start_key="fuse_retrievals", end_key="grade_documents")
 
     # 添加从起始到代理的边
     workflow.add_edge(START, end_key="agent")
     # 添加代理的条件边，根据工具调用的工具名称决定下一步路由
-    workflow.add_conditional_edges(source="agent", path=tools_condition, path_map={"tools": "call_tools", END: END})
+    workflow.add_conditional_edges(source="agent", path=tools_condition, path_map={"tools": tools_entry, END: END})
     # 添加检索的条件边，根据工具调用的结果动态决定下一步路由
-    workflow.add_conditional_edges(source="call_tools", path=lambda state: route_after_tools(state, tool_config),path_map={"generate": "generate", "grade_documents": "grade_documents"})
+    workflow.add_conditional_edges(source="call_tools", path=lambda state: route_after_tools(state, tool_config),path_map={"generate": "generate", "grade_documents": "fuse_retrievals" if multi_query else "grade_documents"})
     # 添加检索的条件边，根据状态中的评分结果决定下一步路由
     workflow.add_conditional_edges(source="grade_documents", path=route_after_grade, path_map={"generate": "generate", "rewrite": "rewrite"})
     # 添加从生成到结束的边
     workflow.add_edge(start_key="generate", end_key=END)
-    # 添加从重写到代理的边
-    workflow.add_edge(start_key="rewrite", end_key="agent")
+    if Config.REWRITE_DIRECT_RETRIEVE:
+        # 重写后直接以改写后的问题检索，不再经过代理节点；无法构造检索工具调用时回到代理节点
+        add_node("retrieve_rewritten", lambda state: retrieve_rewritten(state, tool_config))
+        workflow.add_edge(start_key="rewrite", end_key="retrieve_rewritten")
+        workflow.add_conditional_edges(source="retrieve_rewritten", path=tools_condition, path_map={"tools": tools_entry, END: "agent"})
+    else:
+        # 添加从重写到代理的边
+        workflow.add_edge(start_key="rewrite", end_key="agent")
+    return workflow
+
+
+# 创建并配置异步状态图，供 FastAPI 服务通过 graph.astream 调用，请求处理期间不阻塞事件循环
+async def create_async_graph(db_connection_pool: AsyncConnectionPool, llm_chat, llm_embedding, tool_config: ToolConfig) -> StateGraph:
+    """创建并配置异步状态图，节点函数、检查点及存储均使用异步版本。
+
+    Args:
+        db_connection_pool: 已打开的异步数据库连接池。
+        llm_chat: Chat模型。
+        llm_embedding: Embedding模型。
+        tool_config: 工具配置参数。
+
+    Returns:
+        StateGraph: 编译后的状态图。
+
+    Raises:
+        ConnectionPoolError: 如果连接池未正确初始化或状态异常。
+    """
+    # 检查连接池是否为None或未打开
+    if db_connection_pool is None or db_connection_pool.closed:
+        logger.error("Connection db_connection_pool is None or closed")
+        raise ConnectionPoolError("数据库连接池未初始化或已关闭")
+    try:
+        if not await atest_connection(db_connection_pool):
+            raise ConnectionPoolError("连接池测试失败")
+        logger.info("Async connection db_connection_pool status: OK, test connection successful")
+    except OperationalError as e:
+        logger.error(f"Database operational error during connection test: {e}")
+        raise ConnectionPoolError(f"连接池测试失败，可能已关闭或超时: {str(e)}")
+    except Exception as e:
+        logger.error(f"Failed to verify connection db_connection_pool status: {e}")
+        raise ConnectionPoolError(f"无法验证连接池状态: {str(e)}")
+
+    # 线程内持久化存储
+    try:
+        checkpointer = AsyncPostgresSaver(db_connection_pool)
+        await checkpointer.setup()
+    except Exception as e:
+        logger.error(f"Failed to setup AsyncPostgresSaver: {e}")
+        raise ConnectionPoolError(f"检查点初始化失败: {str(e)}")
+
+    # 跨线程持久化存储
+    try:
+        store = AsyncPostgresStore(db_connection_pool, index={"dims": 1536, "embed": llm_embedding})
+        await store.setup()
+    except Exception as e:
+        logger.error(f"Failed to setup AsyncPostgresStore: {e}")
+        raise ConnectionPoolError(f"存储初始化失败: {str(e)}")
+
+    # 相关性评分快速通道，计数在进程内累计
+    gate = create_relevance_gate()
+
+    # 异步节点函数，langgraph 根据函数是否为协程函数决定调用方式，因此不能使用返回协程的 lambda
+    async def agent_node(state, config):
+        return await aagent(state, config, store=store, llm_chat=llm_chat, tool_config=tool_config)
+
+    async def rewrite_node(state):
+        return await arewrite(state, llm_chat=llm_chat)
+
+    async def generate_node(state):
+        return await agenerate(state, llm_chat=llm_chat)
+
+    async def grade_documents_node(state):
+        return await agrade_documents(state, llm_chat=llm_chat, gate=gate)
+
+    async def expand_queries_node(state):
+        return await aexpand_queries(state, llm_chat=llm_chat, tool_config=tool_config)
+
+    workflow = build_workflow({
+        "agent": agent_node,
+        "rewrite": rewrite_node,
+        "generate": generate_node,
+        "grade_documents": grade_documents_node,
+        "expand_queries": expand_queries_node,
+    }, tool_config)
 
     # 编译状态图，绑定检查点和存储
     return workflow.compile(checkpointer=checkpointer, store=store)
@@ -0,0 +1,48 @@
+# 功能说明：近似重复文本块过滤的测试：相同及近似相同的文本块去掉，内容不同的文本块保留
+from utils.dedup import NearDuplicateFilter
+
+
+BASE = ("DeepSeek-V3 is a strong Mixture-of-Experts language model with 671B total parameters, "
+        "of which 37B are activated for each token, trained on 14.8 trillion tokens.")
+
+
+def test_exact_and_normalized_duplicates_are_dropped():
+    dedup = NearDuplicateFilter(threshold=0.85)
+    assert not dedup.is_duplicate(BASE)
+    assert dedup.is_duplicate(BASE)
+    # 全半角、空白及大小写差异在规范化后相同
+    assert dedup.is_duplicate("  " + BASE.upper().replace(" ", "   ") + " ")
+
+
+def test_near_duplicate_is_dropped_and_distinct_text_kept():
+    dedup = NearDuplicateFilter(threshold=0.8)
+    assert not dedup.is_duplicate(BASE)
+    # 只改动一个数字，字符n-gram的Jaccard相似度仍远高于阈值
+    assert dedup.is_duplicate(BASE.replace("14.8", "14.9"))
+    assert not dedup.is_duplicate("张三九的健康档案：血压偏高，建议低盐饮食，每天监测血压，并定期复查血脂和血糖。")
+
+
+def test_filter_keeps_first_occurrence_and_input_type():
+    chunks = [{"text": BASE, "page_start": 0}, {"text": "Something entirely different about blood pressure."},
+              {"text": BASE, "page_start": 5}]
+    dedup = NearDuplicateFilter()
+    kept = list(dedup.filter(chunks))
+    assert kept == chunks[:2]
+    assert list(NearDuplicateFilter().filter(["a b c d e f", "a b c d e f"])) == ["a b c d e f"]
+
+
+def test_report_counts_savings():
+    dedup = NearDuplicateFilter()
+    list(dedup.filter([BASE, BASE, BASE, "unrelated text about something else entirely"]))
+    report = dedup.report(batch_size=2)
+    assert report["checked"] == 4
+    assert report["duplicates"] == 2
+    assert report["bytes_saved"] == 2 * len(BASE.encode("utf-8"))
+    assert report["tokens_saved"] > 0
+    assert report["embedding_calls_saved"] == 1
+
+
+def test_same_seed_gives_same_result():
+    texts = [BASE, BASE.replace("strong", "powerful"), BASE.replace("14.8", "15.2"), "totally different"]
+    first, second = NearDuplicateFilter(seed=7), NearDuplicateFilter(seed=7)
+    assert [first.is_duplicate(text) for text in texts] == [second.is_duplicate(text) for text in texts]
@@ -0,0 +1,91 @@
+# 功能说明：PDF流式处理流水线中纯函数的测试：按token切块的大小上限及重叠、命令行页码范围解析
+import pytest
+from utils import pdf_pipeline
+from utils.embedding_engine import estimate_tokens
+
+
+def count_words(text):
+    # 以空格分隔的单词数作为token数，便于精确断言
+    return len(text.split())
+
+
+def make_sentences(count, words=5, page_size=4):
+    # 生成 (页码, 句子)，每句words个单词，每页page_size句
+    return [(i // page_size, ' '.join(f"s{i}w{j}" for j in range(words))) for i in range(count)]
+
+
+def test_iter_chunks_respects_chunk_size():
+    chunks = list(pdf_pipeline.iter_chunks(make_sentences(40), chunk_size=20, overlap_size=5, count_tokens=count_words))
+    assert len(chunks) > 1
+    assert all(count_words(chunk["text"]) <= 20 for chunk in chunks)
+
+
+def test_iter_chunks_max_tokens_caps_chunk_size():
+    chunks = list(pdf_pipeline.iter_chunks(make_sentences(40), chunk_size=400, overlap_size=5, max_tokens=12,
+                                           count_tokens=count_words))
+    assert all(count_words(chunk["text"]) <= 12 for chunk in chunks)
+
+
+def test_iter_chunks_overlap_comes_from_previous_chunk_tail():
+    chunks = list(pdf_pipeline.iter_chunks(make_sentences(40), chunk_size=20, overlap_size=10, count_tokens=count_words))
+    for previous, current in zip(chunks, chunks[1:]):
+        previous_words = previous["text"].split()
+        current_words = current["text"].split()
+        # 重叠部分为上一块末尾的完整句子，不超过overlap_size，且当前块至少有一句新内容
+        overlap = 0
+        while overlap < len(current_words) and current_words[overlap] in previous_words:
+            overlap += 1
+        assert 0 < overlap <= 10
+        assert previous_words[-overlap:] == current_words[:overlap]
+        assert overlap < len(current_words)
+
+
+def test_iter_chunks_zero_overlap_covers_each_sentence_once():
+    sentences = make_sentences(23)
+    chunks = list(pdf_pipeline.iter_chunks(sentences, chunk_size=20, overlap_size=0, count_tokens=count_words))
+    assert ' '.join(chunk["text"] for chunk in chunks) == ' '.join(sentence for _, sentence in sentences)
+
+
+def test_iter_chunks_records_page_range():
+    chunks = list(pdf_pipeline.iter_chunks(make_sentences(8, page_size=2), chunk_size=10, overlap_size=0,
+                                           count_tokens=count_words))
+    assert [(chunk["page_start"], chunk["page_end"]) for chunk in chunks] == [(0, 0), (1, 1), (2, 2), (3, 3)]
+
+
+def test_iter_chunks_splits_sentence_longer_than_limit():
+    long_sentence = ' '.join(f"w{i}" for i in range(50))
+    chunks = list(pdf_pipeline.iter_chunks([(0, long_sentence)], chunk_size=400, overlap_size=0, max_tokens=8,
+                                           count_tokens=count_words))
+    assert len(chunks) > 1
+    assert all(count_words(chunk["text"]) <= 8 for chunk in chunks)
+    assert ' '.join(chunk["text"] for chunk in chunks) == long_sentence
+
+
+def test_iter_chunks_default_estimator_respects_max_tokens():
+    # 中英文混合文本，使用默认的estimate_tokens计数
+    sentences = [(0, "这是一个用于测试切块的中文句子。"), (0, "The quick brown fox jumps over the lazy dog.")] * 30
+    chunks = list(pdf_pipeline.iter_chunks(sentences, chunk_size=400, overlap_size=20, max_tokens=50))
+    assert all(estimate_tokens(chunk["text"]) <= 50 for chunk in chunks)
+
+
+def test_iter_document_chunks_from_pages():
+    # 与pdfminer一致，文本容器以换行结尾，相邻容器之间为空行，即段落分隔
+    pages = [(0, ["First sentence here. Second sentence here.\n"]), (1, ["Third sentence on page two.\n"])]
+    chunks = list(pdf_pipeline.iter_document_chunks(pages, min_line_length=1, chunk_size=400, overlap_size=0))
+    assert len(chunks) == 1
+    assert chunks[0]["text"] == "First sentence here. Second sentence here. Third sentence on page two."
+    assert (chunks[0]["page_start"], chunks[0]["page_end"]) == (0, 1)
+
+
+def test_parse_page_ranges_converts_to_zero_based():
+    assert pdf_pipeline.parse_page_ranges("1-3,7,10-12") == {0, 1, 2, 6, 9, 10, 11}
+
+
+def test_parse_page_ranges_ignores_blanks_and_overlaps():
+    assert pdf_pipeline.parse_page_ranges(" 2 , ,1-2,2-3 ") == {0, 1, 2}
+
+
+@pytest.mark.parametrize("text", ["0", "5-3", "a-b", "1-x"])
+def test_parse_page_ranges_rejects_invalid_ranges(text):
+    with pytest.raises(ValueError):
+        pdf_pipeline.parse_page_ranges(text)
@@ -0,0 +1,123 @@
+# 功能说明：检索器中纯函数的测试：倒数排名融合、混合检索结果的融合、按相关度分数自适应筛选、上下文token预算
+import pytest
+from langchain_core.documents import Document
+from utils.embedding_engine import estimate_tokens
+from utils.retrievers import (AdaptiveRetriever, HybridRetriever, ScoredVectorRetriever, apply_token_budget,
+                              reciprocal_rank_fusion)
+
+
+class FakeVectorStore:
+    """按给定顺序返回 (文档, 距离) 的向量存储，距离为余弦距离"""
+
+    def __init__(self, results):
+        self.results = results
+
+    def similarity_search_with_score(self, query, k=4):
+        return self.results[:k]
+
+    def _select_relevance_score_fn(self):
+        return lambda distance: 1.0 - distance
+
+
+class FakeSparseIndex:
+    def __init__(self, results):
+        self.results = results
+
+    def search(self, query, k):
+        return self.results[:k]
+
+
+def test_reciprocal_rank_fusion_scores():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "a"]], rrf_k=60)
+    scores = dict(fused)
+    assert scores["a"] == pytest.approx(1 / 61 + 1 / 62)
+    assert scores["b"] == pytest.approx(1 / 62)
+    assert scores["c"] == pytest.approx(1 / 63 + 1 / 61)
+    assert [doc_id for doc_id, _ in fused] == ["a", "c", "b"]
+
+
+def test_reciprocal_rank_fusion_handles_empty_rankings():
+    assert reciprocal_rank_fusion([]) == []
+    assert reciprocal_rank_fusion([[], ["x"]]) == [("x", pytest.approx(1 / 61))]
+
+
+def test_hybrid_retriever_fuses_dense_and_sparse_results():
+    dense = [(Document(page_content="vector hit", metadata={"source": "a.pdf"}, id="v"), 0.2),
+             (Document(page_content="both hit", metadata={"source": "a.pdf"}, id="b"), 0.4)]
+    sparse = [("b", "both hit", {"source": "a.pdf"}, 3.0), ("s", "bm25 only", {"source": "b.pdf"}, 2.0)]
+    retriever = HybridRetriever(vectorstore=FakeVectorStore(dense), sparse_index=FakeSparseIndex(sparse), k=3)
+    results = retriever.invoke("query")
+    assert [document.id for document in results] == ["b", "v", "s"]
+    assert results[0].metadata["relevance_score"] == pytest.approx(0.6)
+    assert results[1].metadata["vector_distance"] == pytest.approx(0.2)
+    # 仅由BM25召回的文档没有向量分数
+    assert "relevance_score" not in results[2].metadata
+    assert all("rrf_score" in document.metadata for document in results)
+
+
+def scored(*items):
+    # (内容, 相关度分数) -> 文档列表，分数为None表示仅由BM25召回
+    return [Document(page_content=text, metadata={} if score is None else {"relevance_score": score}, id=text)
+            for text, score in items]
+
+
+def adaptive(**kwargs):
+    return AdaptiveRetriever(retriever=ScoredVectorRetriever(vectorstore=FakeVectorStore([])), **kwargs)
+
+
+def contents(documents):
+    return [document.page_content for document in documents]
+
+
+def test_select_applies_min_score_and_score_gap():
+    candidates = scored(("a", 0.9), ("b", 0.85), ("c", 0.7), ("d", 0.2))
+    assert contents(adaptive(min_score=0.25, max_score_gap=0.1)._select(candidates)) == ["a", "b"]
+    assert contents(adaptive(min_score=0.25)._select(candidates)) == ["a", "b", "c"]
+
+
+def test_select_always_keeps_top_ranked_document():
+    # 混合检索时排名第一的可能是向量分数较低的BM25精确匹配，即使低于min_score也要保留
+    candidates = scored(("exact", 0.1), ("b", 0.8), ("c", 0.05))
+    assert contents(adaptive(min_score=0.25, max_score_gap=0.1)._select(candidates)) == ["exact", "b"]
+
+
+def test_select_keeps_sparse_only_documents_and_fills_min_k():
+    candidates = scored(("a", 0.9), ("bm25", None), ("c", 0.1), ("d", 0.05))
+    assert contents(adaptive(min_score=0.5)._select(candidates)) == ["a", "bm25"]
+    assert contents(adaptive(min_score=0.5, min_k=3)._select(candidates)) == ["a", "bm25", "c"]
+
+
+def test_select_applies_token_budget():
+    candidates = scored(("一二三四五", 0.9), ("六七八九十", 0.85))
+    assert contents(adaptive(max_tokens=7)._select(candidates)) == ["一二三四五"]
+    assert adaptive()._select([]) == []
+
+
+def test_apply_token_budget_keeps_documents_in_rank_order():
+    documents = scored(("一二三", None), ("四五六", None), ("七八九", None))
+    kept, used = apply_token_budget(documents, 7)
+    assert contents(kept) == ["一二三", "四五六"]
+    assert used == 6
+
+
+def test_apply_token_budget_without_limit_keeps_everything():
+    documents = scored(("one two", None), ("three", None))
+    kept, used = apply_token_budget(documents, None)
+    assert kept == documents
+    assert used == sum(estimate_tokens(document.page_content) for document in documents)
+
+
+def test_apply_token_budget_truncates_oversized_top_document():
+    document = Document(page_content="字" * 100, metadata={"source": "a.pdf"}, id="top")
+    kept, used = apply_token_budget([document], 30)
+    assert len(kept) == 1
+    assert used <= 30
+    assert kept[0].page_content == "字" * 30
+    assert kept[0].metadata == {"source": "a.pdf"} and kept[0].id == "top"
+
+
+def test_apply_token_budget_stops_at_first_document_over_budget():
+    # 超出预算的文档之后即使有更短的文档也不再保留，保持排名顺序
+    documents = scored(("一二三", None), ("四五六七八九十", None), ("甲", None))
+    kept, _ = apply_token_budget(documents, 5)
+    assert contents(kept) == ["一二三"]
@@ -0,0 +1,43 @@
+# 功能说明：中英文混合文本断句的测试：按段落检测语言、中英文句末标点、英文缩写及列表序号
+from utils.sentence_segmenter import detect_language, sent_tokenize
+
+
+def strip_all(sentences):
+    return [sentence.strip() for sentence in sentences]
+
+
+def test_detect_language():
+    assert detect_language("DeepSeek-V3 采用 MoE 架构，训练成本很低。") == "zh"
+    assert detect_language("DeepSeek-V3 uses a Mixture-of-Experts architecture.") == "en"
+    assert detect_language("") == "en"
+
+
+def test_chinese_punctuation_and_half_width_marks():
+    assert sent_tokenize("DeepSeek-V3 采用 MoE 架构。它的训练成本很低！是吗?当然") == \
+        ["DeepSeek-V3 采用 MoE 架构。", "它的训练成本很低！", "是吗?", "当然"]
+
+
+def test_chinese_closing_quote_stays_with_sentence():
+    assert sent_tokenize("他说：“很好。”然后离开了。") == ["他说：“很好。”", "然后离开了。"]
+
+
+def test_english_abbreviations_do_not_split():
+    text = "We use MoE, e.g. DeepSeek-V3. Dr. Smith agrees. See Fig. 3 for details. It works!"
+    assert strip_all(sent_tokenize(text)) == \
+        ["We use MoE, e.g. DeepSeek-V3.", "Dr. Smith agrees.", "See Fig. 3 for details.", "It works!"]
+
+
+def test_english_list_markers_and_decimals():
+    assert strip_all(sent_tokenize("1. First item is here. 2. Second item.")) == ["1. First item is here.", "2. Second item."]
+    assert strip_all(sent_tokenize("Accuracy rose to 88.5 on MMLU. It is open-source.")) == \
+        ["Accuracy rose to 88.5 on MMLU.", "It is open-source."]
+
+
+def test_mixed_paragraph_splits_both_languages():
+    text = "模型在 MMLU 上得分 88.5。The model is open-source. 欢迎使用。"
+    assert strip_all(sent_tokenize(text)) == ["模型在 MMLU 上得分 88.5。", "The model is open-source.", "欢迎使用。"]
+
+
+def test_blank_text_yields_no_sentences():
+    assert sent_tokenize("") == []
+    assert sent_tokenize("   ") == []
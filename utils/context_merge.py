@@ -0,0 +1,136 @@
+# 功能说明：检索结果的上下文去重，在构造ToolMessage之前合并同一来源中首尾重叠的文本块，并去掉重复的句子
+# 灌库切块时相邻文本块之间有重叠（上一块末尾的若干句子即下一块开头），同时召回相邻文本块时重叠部分会被评分和生成各发送一次
+import re
+import logging
+from typing import List, Optional
+from langchain_core.documents import Document
+from utils.embedding_cache import normalize_text
+from utils.embedding_engine import estimate_tokens
+
+
+# 设置日志模版
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+# 句子切分：中文句末标点，或英文句末标点后跟空白
+_SENTENCE_PATTERN = re.compile(r'.+?(?:[。！？!?]+|\.(?=\s)|$)', re.S)
+
+
+def find_overlap(first: str, second: str, min_overlap: int) -> int:
+    """
+    计算first的末尾与second的开头重叠的最大字符数
+
+    Args:
+        first (str): 排在前面的文本
+        second (str): 排在后面的文本
+        min_overlap (int): 最少重叠的字符数，不足时视为不重叠
+
+    Returns:
+        int: 重叠的字符数，不重叠时为0
+    """
+    if len(first) < min_overlap or len(second) < min_overlap:
+        return 0
+    head = second[:min_overlap]
+    position = first.find(head, max(0, len(first) - len(second)))
+    while position != -1:
+        if second.startswith(first[position:]):
+            return len(first) - position
+        position = first.find(head, position + 1)
+    return 0
+
+
+def _merge_pair(first: Document, second: Document, overlap: int, primary: Document) -> Document:
+    # 按重叠部分拼接两个文本块，元数据取排名靠前者primary，页码范围取并集，相关度分数取较高者
+    metadata = dict(primary.metadata)
+    for key, pick in (("page_start", min), ("page_end", max), ("relevance_score", max)):
+        values = [doc.metadata[key] for doc in (first, second) if doc.metadata.get(key) is not None]
+        if values:
+            metadata[key] = pick(values)
+    metadata["merged_chunks"] = first.metadata.get("merged_chunks", 1) + second.metadata.get("merged_chunks", 1)
+    return Document(page_content=first.page_content + second.page_content[overlap:], metadata=metadata, id=primary.id)
+
+
+def merge_overlapping(documents: List[Document], min_overlap: int = 20) -> List[Document]:
+    """
+    合并同一来源中首尾重叠的文本块，去掉被其他文本块完全包含的文本块
+    结果保持原有的排名顺序，合并后的文档位于其中排名最靠前者的位置
+
+    Args:
+        documents (list): 按相关度排好序的文档
+        min_overlap (int): 判定为重叠的最少字符数
+
+    Returns:
+        list: 合并后的文档
+    """
+    merged = list(documents)
+    while True:
+        pair = None
+        for i in range(len(merged)):
+            for j in range(len(merged)):
+                if i == j or merged[i].metadata.get("source") != merged[j].metadata.get("source"):
+                    continue
+                first, second = merged[i].page_content, merged[j].page_content
+                # 被完全包含时视为整体重叠
+                overlap = len(second) if second in first else find_overlap(first, second, min_overlap)
+                if overlap:
+                    pair = (i, j, overlap)
+                    break
+            if pair:
+                break
+        if pair is None:
+            return merged
+        i, j, overlap = pair
+        keep, drop = min(i, j), max(i, j)
+        merged[keep] = _merge_pair(merged[i], merged[j], overlap, merged[keep])
+        del merged[drop]
+
+
+def remove_repeated_sentences(documents: List[Document], min_length: int = 20) -> List[Document]:
+    """
+    去掉在排名更靠前的文档中已经出现过的句子（规范化后完全相同，且不短于min_length个字符），去掉后为空的文档整体删除
+
+    Args:
+        documents (list): 按相关度排好序的文档
+        min_length (int): 参与去重的最短句子长度，短句（如标题、编号）保留
+
+    Returns:
+        list: 去重后的文档
+    """
+    seen = set()
+    results = []
+    for document in documents:
+        kept = []
+        for sentence in _SENTENCE_PATTERN.findall(document.page_content):
+            key = normalize_text(sentence)
+            if len(key) >= min_length:
+                if key in seen:
+                    continue
+                seen.add(key)
+            kept.append(sentence)
+        text = ''.join(kept).strip()
+        if text:
+            results.append(Document(page_content=text, metadata=document.metadata, id=document.id))
+    return results
+
+
+def deduplicate_context(documents: List[Document], min_overlap: int = 20,
+                        min_sentence_length: Optional[int] = 20) -> List[Document]:
+    """
+    检索结果的上下文去重：先合并首尾重叠的文本块，再去掉重复的句子，并记录节省的token数
+
+    Args:
+        documents (list): 按相关度排好序的文档
+        min_overlap (int): 判定为重叠的最少字符数
+        min_sentence_length (int): 参与去重的最短句子长度，None表示不做句子去重
+
+    Returns:
+        list: 去重后的文档
+    """
+    before = sum(estimate_tokens(document.page_content) for document in documents)
+    results = merge_overlapping(documents, min_overlap)
+    if min_sentence_length is not None:
+        results = remove_repeated_sentences(results, min_sentence_length)
+    after = sum(estimate_tokens(document.page_content) for document in results)
+    logger.info(f"上下文去重: {len(documents)}条文档合并为{len(results)}条，约{before}个token减少为{after}个，节省{before - after}个")
+    return results
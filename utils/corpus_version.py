@@ -0,0 +1,62 @@
+# 功能说明：知识库版本号，灌库写入了新内容时更新，依赖知识库内容的缓存（如语义答案缓存）按版本号失效
+import os
+import time
+import uuid
+import logging
+
+
+# 设置日志模版
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+# 从未灌库时的版本号
+INITIAL_VERSION = "initial"
+
+# 版本号文件按修改时间在进程内缓存，文件未变化时不重复读取
+_cached = {}
+
+
+def read_corpus_version(path: str) -> str:
+    """读取知识库版本号，版本号文件不存在时返回INITIAL_VERSION"""
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return INITIAL_VERSION
+    cached = _cached.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with open(path, encoding='utf-8') as f:
+        version = f.read().strip() or INITIAL_VERSION
+    _cached[path] = (mtime, version)
+    return version
+
+
+def new_corpus_version() -> str:
+    """生成新的知识库版本号：时间戳加随机后缀"""
+    return f"{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+
+def bump_corpus_version(path: str) -> str:
+    """生成新的知识库版本号并写入文件，先写临时文件再替换，返回新版本号"""
+    version = new_corpus_version()
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding='utf-8') as f:
+        f.write(version)
+    os.replace(tmp_path, path)
+    logger.info(f"知识库版本号更新为: {version}")
+    return version
+
+
+class FileCorpusVersion:
+    """知识库版本号存储在本地文件中，只适用于灌库脚本与API服务在同一台机器上的部署"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def read(self) -> str:
+        return read_corpus_version(self.path)
+
+    def bump(self) -> str:
+        return bump_corpus_version(self.path)
@@ -0,0 +1,130 @@
+# 功能说明：灌库前的近似重复文本块过滤，基于字符n-gram的MinHash签名及LSH分桶
+# 页眉页脚、模板文字及相邻文本块的重叠部分会产生大量近似相同的文本块，在计算向量之前去掉，减少向量计算次数和索引大小
+import zlib
+import logging
+import numpy as np
+from utils.embedding_cache import normalize_text
+from utils.embedding_engine import estimate_tokens
+
+
+# 设置日志模版
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+# 大于2^32的素数，哈希值及置换参数均小于2^32，(a * x + b)不会超出uint64的范围
+_PRIME = np.uint64(4294967311)
+_MAX_HASH = np.uint64(0xFFFFFFFF)
+
+
+def _choose_bands(num_perm, threshold):
+    # 选择LSH分段数bands及每段行数rows（bands * rows = num_perm），
+    # 使相似度为threshold的两段文本恰好以约50%的概率落入同一桶：(1 / bands) ^ (1 / rows) ≈ threshold
+    best = None
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        error = abs((1.0 / bands) ** (1.0 / rows) - threshold)
+        if best is None or error < best[0]:
+            best = (error, bands, rows)
+    return best[1], best[2]
+
+
+class NearDuplicateFilter:
+    """
+    近似重复文本块过滤器：与已保留的文本块的Jaccard相似度（字符n-gram集合）达到threshold的文本块视为重复
+
+    按流式顺序处理，每个文本块只与之前保留的文本块比较，先出现的保留、后出现的去掉；
+    先用LSH分桶找出候选，再用MinHash签名估算相似度确认，整体耗时与文本块数量成线性关系
+    """
+
+    def __init__(self, threshold: float = 0.85, num_perm: int = 128, shingle_size: int = 5, seed: int = 1):
+        """
+        Args:
+            threshold (float): 近似重复的相似度阈值（0~1），越小去重越激进
+            num_perm (int): MinHash签名长度，越长估算越准、计算越慢
+            shingle_size (int): 字符n-gram的长度
+            seed (int): 随机种子，固定后同样的输入得到同样的结果
+        """
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, 2 ** 32, size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, 2 ** 32, size=num_perm, dtype=np.uint64)
+        self.bands, self.rows = _choose_bands(num_perm, threshold)
+        # LSH桶 {(段序号, 该段签名): [保留的文本块序号]}，以及保留的文本块签名
+        self._buckets = {}
+        self._signatures = []
+        self.checked = 0
+        self.duplicates = 0
+        self.bytes_saved = 0
+        self.tokens_saved = 0
+
+    def _signature(self, text):
+        # 计算文本的MinHash签名：字符n-gram哈希后分别经num_perm个置换，取各置换下的最小值
+        text = normalize_text(text).lower()
+        size = self.shingle_size
+        shingles = {text[i:i + size] for i in range(max(1, len(text) - size + 1))}
+        hashes = np.fromiter((zlib.crc32(shingle.encode('utf-8')) for shingle in shingles),
+                             dtype=np.uint64, count=len(shingles))
+        permuted = (np.outer(hashes, self._a) + self._b) % _PRIME & _MAX_HASH
+        return permuted.min(axis=0)
+
+    def _band_keys(self, signature):
+        return [(i, signature[i * self.rows:(i + 1) * self.rows].tobytes()) for i in range(self.bands)]
+
+    def is_duplicate(self, text: str) -> bool:
+        """判断文本是否与已保留的文本近似重复，不重复时将其加入已保留的集合"""
+        self.checked += 1
+        signature = self._signature(text)
+        keys = self._band_keys(signature)
+        candidates = set()
+        for key in keys:
+            candidates.update(self._buckets.get(key, ()))
+        for candidate in candidates:
+            # 签名中相同位置的比例即Jaccard相似度的估计值
+            if np.count_nonzero(self._signatures[candidate] == signature) >= self.threshold * self.num_perm:
+                self.duplicates += 1
+                self.bytes_saved += len(text.encode('utf-8'))
+                self.tokens_saved += estimate_tokens(text)
+                return True
+        index = len(self._signatures)
+        self._signatures.append(signature)
+        for key in keys:
+            self._buckets.setdefault(key, []).append(index)
+        return False
+
+    def filter(self, chunks):
+        """
+        过滤文本块流，去掉近似重复的文本块
+
+        Args:
+            chunks: 文本或文本块字典 {"text": 文本, ...} 的可迭代对象，可以是生成器
+
+        Yields:
+            非重复的文本块，与输入类型一致
+        """
+        for chunk in chunks:
+            text = chunk["text"] if isinstance(chunk, dict) else chunk
+            if not self.is_duplicate(text):
+                yield chunk
+
+    def report(self, batch_size: int = 1) -> dict:
+        """
+        返回去重统计
+
+        Args:
+            batch_size (int): 向量接口每次请求的文本数，用于估算节省的请求次数
+
+        Returns:
+            dict: 检查的文本块数、去掉的文本块数、节省的字节数、token数及向量计算请求次数
+        """
+        return {
+            "checked": self.checked,
+            "duplicates": self.duplicates,
+            "bytes_saved": self.bytes_saved,
+            "tokens_saved": self.tokens_saved,
+            "embedding_calls_saved": -(-self.duplicates // max(1, batch_size)),
+        }
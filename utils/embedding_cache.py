@@ -0,0 +1,342 @@
+# 功能说明：基于SQLite的持久化向量缓存，按(服务商, 模型, 规范化文本哈希)寻址，灌库和查询共用，按占用空间淘汰
+import os
+import re
+import time
+import array
+import asyncio
+import sqlite3
+import hashlib
+import atexit
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import List, Optional
+from langchain_core.embeddings import Embeddings
+
+
+# 设置日志模版
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+# 默认缓存文件位置及最大占用空间
+DEFAULT_CACHE_PATH = "cache/embeddings.sqlite3"
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+# SQLite单条语句的参数个数有上限，批量查询时分段执行
+_SQL_CHUNK_SIZE = 500
+
+# 命中时的访问时间先记在内存中，累计到一定条数或间隔一定秒数后再批量写回，避免每次命中都写库提交
+_TOUCH_FLUSH_SIZE = 1000
+_TOUCH_FLUSH_INTERVAL = 30.0
+
+_WHITESPACE_PATTERN = re.compile(r'\s+')
+
+
+def normalize_text(text: str) -> str:
+    """规范化文本：统一全半角(NFKC)，合并连续空白并去掉首尾空白"""
+    return _WHITESPACE_PATTERN.sub(' ', unicodedata.normalize('NFKC', text)).strip()
+
+
+def make_cache_key(provider: str, model: str, text: str) -> str:
+    """根据服务商、模型和规范化后的文本生成缓存键"""
+    digest = hashlib.sha256(normalize_text(text).encode('utf-8')).hexdigest()
+    return f"{provider}:{model}:{digest}"
+
+
+class EmbeddingCache:
+    """
+    持久化向量缓存，线程安全
+
+    向量以float32二进制存储；总占用超过max_bytes时，按最近访问时间淘汰最久未使用的条目
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_bytes: int = DEFAULT_MAX_BYTES):
+        """
+        Args:
+            path (str): SQLite数据库文件路径
+            max_bytes (int): 缓存向量的最大占用字节数
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                vector BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings (last_access)")
+        self._conn.commit()
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+        self._pending_touches = {}
+        self._last_flush = time.monotonic()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, provider: str, model: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """
+        批量查询缓存
+
+        Returns:
+            list: 与texts等长的列表，未命中的位置为None
+        """
+        keys = [make_cache_key(provider, model, text) for text in texts]
+        found = {}
+        with self._lock:
+            unique_keys = list(dict.fromkeys(keys))
+            for i in range(0, len(unique_keys), _SQL_CHUNK_SIZE):
+                part = unique_keys[i:i + _SQL_CHUNK_SIZE]
+                placeholders = ','.join('?' * len(part))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", part
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array.array('f', blob).tolist()
+            if found:
+                now = time.time()
+                self._pending_touches.update((key, now) for key in found)
+                if (len(self._pending_touches) >= _TOUCH_FLUSH_SIZE
+                        or time.monotonic() - self._last_flush >= _TOUCH_FLUSH_INTERVAL):
+                    self._flush_touches()
+                    self._conn.commit()
+        results = [found.get(key) for key in keys]
+        hit_count = sum(1 for vector in results if vector is not None)
+        self.hits += hit_count
+        self.misses += len(results) - hit_count
+        return results
+
+    def put_many(self, provider: str, model: str, texts: List[str], vectors: List[List[float]]):
+        """批量写入缓存，并在超出容量时淘汰旧条目"""
+        now = time.time()
+        rows = {}
+        for text, vector in zip(texts, vectors):
+            if vector is None:
+                continue
+            blob = array.array('f', vector).tobytes()
+            rows[make_cache_key(provider, model, text)] = (blob, len(blob), now)
+        if not rows:
+            return
+        with self._lock:
+            keys = list(rows)
+            # 覆盖已有条目时先扣除其原占用
+            for i in range(0, len(keys), _SQL_CHUNK_SIZE):
+                part = keys[i:i + _SQL_CHUNK_SIZE]
+                placeholders = ','.join('?' * len(part))
+                self._total_bytes -= self._conn.execute(
+                    f"SELECT COALESCE(SUM(size), 0) FROM embeddings WHERE key IN ({placeholders})", part
+                ).fetchone()[0]
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, size, last_access) VALUES (?, ?, ?, ?)",
+                [(key, blob, size, last_access) for key, (blob, size, last_access) in rows.items()]
+            )
+            self._total_bytes += sum(size for _, size, _ in rows.values())
+            # 淘汰前先写回命中记录，保证按最新的访问时间淘汰
+            self._flush_touches()
+            self._evict()
+            self._conn.commit()
+
+    def flush(self):
+        """把内存中尚未写回的访问时间写入数据库"""
+        with self._lock:
+            self._flush_touches()
+            self._conn.commit()
+
+    def _flush_touches(self):
+        # 调用方需持有self._lock；刚写入的条目被覆盖时，保留较新的访问时间
+        if self._pending_touches:
+            self._conn.executemany(
+                "UPDATE embeddings SET last_access = MAX(last_access, ?) WHERE key = ?",
+                [(last_access, key) for key, last_access in self._pending_touches.items()]
+            )
+            self._pending_touches.clear()
+        self._last_flush = time.monotonic()
+
+    def _evict(self):
+        # 超出容量时，淘汰最久未访问的条目直到占用降到容量的90%
+        if self._total_bytes <= self.max_bytes:
+            return
+        target = int(self.max_bytes * 0.9)
+        evicted = 0
+        while self._total_bytes > target:
+            rows = self._conn.execute(
+                "SELECT key, size FROM embeddings ORDER BY last_access LIMIT ?", (_SQL_CHUNK_SIZE,)
+            ).fetchall()
+            if not rows:
+                self._total_bytes = 0
+                break
+            batch = []
+            for key, size in rows:
+                batch.append((key,))
+                self._total_bytes -= size
+                if self._total_bytes <= target:
+                    break
+            self._conn.executemany("DELETE FROM embeddings WHERE key = ?", batch)
+            evicted += len(batch)
+        logger.info(f"向量缓存超出容量，淘汰{evicted}条，当前占用{self._total_bytes}字节")
+
+    def stats(self) -> dict:
+        """返回缓存命中统计及占用空间"""
+        return {"hits": self.hits, "misses": self.misses, "bytes": self._total_bytes, "max_bytes": self.max_bytes}
+
+
+# 同一路径的缓存在进程内共享一个实例
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_embedding_cache(path: str = DEFAULT_CACHE_PATH, max_bytes: int = DEFAULT_MAX_BYTES) -> EmbeddingCache:
+    """获取指定路径的缓存实例，同一进程内复用"""
+    with _caches_lock:
+        if path not in _caches:
+            _caches[path] = EmbeddingCache(path, max_bytes)
+            # 进程退出时写回尚未落盘的访问时间
+            atexit.register(_caches[path].flush)
+        return _caches[path]
+
+
+class CachedEmbeddings(Embeddings):
+    """为LangChain的Embeddings对象加上持久化缓存，命中的文本不再调用向量接口"""
+
+    def __init__(self, embeddings: Embeddings, cache: EmbeddingCache, provider: str, model: str):
+        """
+        Args:
+            embeddings (Embeddings): 被包装的向量模型实例
+            cache (EmbeddingCache): 向量缓存
+            provider (str): 服务商名称，参与缓存寻址
+            model (str): 向量模型名称，参与缓存寻址
+        """
+        self.embeddings = embeddings
+        self.cache = cache
+        self.provider = provider
+        self.model = model
+
+    def _lookup(self, texts: List[str]):
+        vectors = self.cache.get_many(self.provider, self.model, texts)
+        misses = [i for i, vector in enumerate(vectors) if vector is None]
+        return vectors, misses
+
+    def _fill(self, texts, vectors, misses, computed):
+        self.cache.put_many(self.provider, self.model, [texts[i] for i in misses], computed)
+        for i, vector in zip(misses, computed):
+            vectors[i] = vector
+        return vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        texts = list(texts)
+        vectors, misses = self._lookup(texts)
+        if misses:
+            computed = self.embeddings.embed_documents([texts[i] for i in misses])
+            vectors = self._fill(texts, vectors, misses, computed)
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        vector = self.cache.get_many(self.provider, self.model, [text])[0]
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self.cache.put_many(self.provider, self.model, [text], [vector])
+        return vector
+
+    # 异步接口中的SQLite读写是阻塞调用，放到线程中执行，避免阻塞事件循环
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        texts = list(texts)
+        vectors, misses = await asyncio.to_thread(self._lookup, texts)
+        if misses:
+            computed = await self.embeddings.aembed_documents([texts[i] for i in misses])
+            vectors = await asyncio.to_thread(self._fill, texts, vectors, misses, computed)
+        return vectors
+
+    async def aembed_query(self, text: str) -> List[float]:
+        vector = (await asyncio.to_thread(self.cache.get_many, self.provider, self.model, [text]))[0]
+        if vector is None:
+            vector = await self.embeddings.aembed_query(text)
+            await asyncio.to_thread(self.cache.put_many, self.provider, self.model, [text], [vector])
+        return vector
+
+
+class LRUQueryEmbeddings(Embeddings):
+    """
+    为查询向量加上进程内的LRU缓存（可选TTL），重复的问题不再访问向量接口或磁盘缓存，线程安全
+
+    只缓存embed_query的结果，embed_documents直接调用被包装的对象；按规范化后的文本寻址
+    """
+
+    def __init__(self, embeddings: Embeddings, max_size: int = 1024, ttl: Optional[float] = None,
+                 log_interval: int = 1000):
+        """
+        Args:
+            embeddings (Embeddings): 被包装的向量模型实例
+            max_size (int): 最多缓存的查询数，超出时淘汰最久未使用的查询
+            ttl (float): 缓存有效期（秒），None表示不过期
+            log_interval (int): 每处理多少个查询以INFO级别输出一次命中统计，其余查询只输出DEBUG日志
+        """
+        self.embeddings = embeddings
+        self.max_size = max_size
+        self.ttl = ttl
+        self.log_interval = log_interval
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (self.ttl is None or time.monotonic() - entry[1] < self.ttl):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def _put(self, key, vector):
+        with self._lock:
+            self._entries[key] = (vector, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        key = normalize_text(text)
+        vector = self._get(key)
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self._put(key, vector)
+        self._log_stats()
+        return vector
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.embeddings.aembed_documents(texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        key = normalize_text(text)
+        vector = self._get(key)
+        if vector is None:
+            vector = await self.embeddings.aembed_query(text)
+            self._put(key, vector)
+        self._log_stats()
+        return vector
+
+    def _log_stats(self):
+        # 查询路径上每次都输出INFO日志会刷屏，按log_interval间隔输出
+        if self.log_interval and (self.hits + self.misses) % self.log_interval == 0:
+            logger.info(f"查询向量缓存统计: {self.stats()}")
+        else:
+            logger.debug(f"查询向量缓存统计: {self.stats()}")
+
+    def stats(self) -> dict:
+        """返回命中统计及当前缓存的查询数"""
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries), "max_size": self.max_size}
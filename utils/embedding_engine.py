@@ -0,0 +1,280 @@
+# 功能说明：向量计算引擎，按服务商限速（每秒请求数/每分钟token数）并发调用向量接口，结果按输入顺序返回
+# 批大小自适应：超出接口限制时减小、请求快速成功时增大；超出限制或含有非法输入的批次拆分重试，无法计算的文本单独报告
+import re
+import time
+import random
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+# 设置日志模版
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+# 中日韩字符，一个字约等于一个token
+_CJK_PATTERN = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]')
+# 英文单词及数字串
+_WORD_PATTERN = re.compile(r'[A-Za-z0-9]+')
+# 其余非空白字符（标点、符号等）
+_SYMBOL_PATTERN = re.compile(r'[^\sA-Za-z0-9\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]')
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    粗略估算文本的token数，用于限速和切块，偏保守（宁可高估）
+
+    Args:
+        text (str): 待估算的文本
+
+    Returns:
+        int: 估算的token数
+    """
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    # 英文单词按子词切分，约每4个字符一个token
+    words = sum(1 + len(word) // 4 for word in _WORD_PATTERN.findall(text))
+    symbols = len(_SYMBOL_PATTERN.findall(text))
+    return cjk + words + symbols
+
+
+class EmbeddingError(Exception):
+    """向量接口调用失败，status_code为HTTP状态码，没有状态码时为None；transient表示网络错误、超时等可重试的错误"""
+
+    def __init__(self, message: str, status_code: int = None, transient: bool = False):
+        super().__init__(message)
+        self.status_code = status_code
+        self.transient = transient
+
+
+# 请求内容超出接口限制（单条token数、单批条数或请求体大小）的错误信息
+_TOO_LARGE_PATTERN = re.compile(
+    r'maximum context length|too many tokens|token limit|too long|too large|input length|batch size|larger than|exceed',
+    re.IGNORECASE
+)
+
+# 没有状态码时视为网络错误或超时（可重试）的异常类名，按类名匹配以兼容OpenAI SDK、httpx及requests的异常
+_TRANSIENT_EXCEPTION_NAMES = {"ConnectionError", "TimeoutError", "Timeout", "APIConnectionError", "APITimeoutError",
+                              "TransportError", "TimeoutException"}
+
+# 错误分类：批次过大、含有非法输入、可重试的临时错误、与输入无关的不可重试错误
+ERROR_TOO_LARGE = "too_large"
+ERROR_INVALID_INPUT = "invalid_input"
+ERROR_TRANSIENT = "transient"
+ERROR_PERMANENT = "permanent"
+
+
+def classify_error(error: Exception) -> str:
+    """
+    根据HTTP状态码及错误信息对向量接口的错误分类，兼容OpenAI SDK的异常及EmbeddingError
+
+    Returns:
+        str: ERROR_TOO_LARGE（413或400/422中提示超出长度/批大小限制）、ERROR_INVALID_INPUT（其余400/422）、
+             ERROR_TRANSIENT（限流、超时、5xx及网络错误）、
+             ERROR_PERMANENT（鉴权失败、模型不存在等其余4xx，以及没有状态码的其他异常，如本地程序错误）
+    """
+    status_code = getattr(error, "status_code", None)
+    if status_code == 413:
+        return ERROR_TOO_LARGE
+    if status_code in (400, 422):
+        return ERROR_TOO_LARGE if _TOO_LARGE_PATTERN.search(str(error)) else ERROR_INVALID_INPUT
+    if status_code is None:
+        if getattr(error, "transient", False) or any(cls.__name__ in _TRANSIENT_EXCEPTION_NAMES for cls in type(error).__mro__):
+            return ERROR_TRANSIENT
+        return ERROR_PERMANENT
+    if status_code in (408, 409, 429) or status_code >= 500:
+        return ERROR_TRANSIENT
+    return ERROR_PERMANENT
+
+
+class RateLimiter:
+    """令牌桶限速器，同时限制每秒请求数(RPS)和每分钟token数(TPM)，线程安全"""
+
+    def __init__(self, requests_per_second: float = None, tokens_per_minute: float = None):
+        """
+        Args:
+            requests_per_second (float): 每秒最多请求数，None表示不限
+            tokens_per_minute (float): 每分钟最多token数，None表示不限
+        """
+        self.requests_per_second = requests_per_second
+        self.tokens_per_minute = tokens_per_minute
+        # 两个令牌桶初始为满，容量分别为1秒的请求配额和1分钟的token配额
+        self._request_allowance = float(requests_per_second or 0)
+        self._token_allowance = float(tokens_per_minute or 0)
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        if self.requests_per_second:
+            self._request_allowance = min(float(self.requests_per_second),
+                                          self._request_allowance + elapsed * self.requests_per_second)
+        if self.tokens_per_minute:
+            self._token_allowance = min(float(self.tokens_per_minute),
+                                        self._token_allowance + elapsed * self.tokens_per_minute / 60.0)
+
+    def acquire(self, tokens: int = 0):
+        """阻塞直到可以发出一次消耗tokens个token的请求"""
+        if not self.requests_per_second and not self.tokens_per_minute:
+            return
+        # 单次请求超过桶容量时按桶容量计，避免永远等待
+        if self.tokens_per_minute:
+            tokens = min(tokens, self.tokens_per_minute)
+        while True:
+            with self._lock:
+                self._refill()
+                wait = 0.0
+                if self.requests_per_second and self._request_allowance < 1:
+                    wait = max(wait, (1 - self._request_allowance) / self.requests_per_second)
+                if self.tokens_per_minute and self._token_allowance < tokens:
+                    wait = max(wait, (tokens - self._token_allowance) * 60.0 / self.tokens_per_minute)
+                if wait <= 0:
+                    if self.requests_per_second:
+                        self._request_allowance -= 1
+                    if self.tokens_per_minute:
+                        self._token_allowance -= tokens
+                    return
+            time.sleep(wait)
+
+
+class EmbeddingEngine:
+    """
+    向量计算引擎：将文本按批次切分，以有界并发调用向量接口，并按服务商配额限速
+
+    embed_fn 接收一个文本列表，返回等长的向量列表，失败时抛出异常（见classify_error）
+    批大小在[1, max_batch_size]之间自适应：批次过大被拒绝时减半，批次在target_latency内成功时增大
+    批次过大或含有非法输入（400/422）时拆成两半重试，直到定位出无法计算的单条文本；
+    临时错误按指数退避重试，重试次数用尽或遇到鉴权失败等与输入无关的错误时整批失败，不再拆分
+    """
+
+    def __init__(self, embed_fn, batch_size: int = 25, max_workers: int = 4,
+                 requests_per_second: float = None, tokens_per_minute: float = None,
+                 max_batch_size: int = None, max_retries: int = 3, target_latency: float = 2.0,
+                 retry_backoff: float = 1.0):
+        """
+        Args:
+            embed_fn: 单批次向量计算函数
+            batch_size (int): 初始的每批次文本数
+            max_workers (int): 最大并发请求数
+            requests_per_second (float): 每秒最多请求数，None表示不限
+            tokens_per_minute (float): 每分钟最多token数，None表示不限
+            max_batch_size (int): 批大小上限，None表示与batch_size相同（不增大）
+            max_retries (int): 临时错误的最大重试次数
+            target_latency (float): 批次请求耗时不超过该值（秒）时增大批大小
+            retry_backoff (float): 重试的初始等待时间（秒），每次重试翻倍
+        """
+        self.embed_fn = embed_fn
+        self.batch_size = max(1, batch_size)
+        self.max_batch_size = max(self.batch_size, max_batch_size or self.batch_size)
+        self.max_workers = max(1, max_workers)
+        self.max_retries = max_retries
+        self.target_latency = target_latency
+        self.retry_backoff = retry_backoff
+        self.rate_limiter = RateLimiter(requests_per_second, tokens_per_minute)
+
+    def _embed_batch(self, batch, attempt):
+        # 重试前按指数退避等待，再按该批次的估算token数申请配额，然后调用向量接口
+        if attempt:
+            time.sleep(self.retry_backoff * (2 ** (attempt - 1)) * (0.5 + random.random()))
+        self.rate_limiter.acquire(sum(estimate_tokens(text) for text in batch))
+        start = time.perf_counter()
+        vectors = self.embed_fn(batch)
+        if len(vectors) != len(batch):
+            raise EmbeddingError(f"批次向量数量与文本数量不一致: {len(vectors)} != {len(batch)}")
+        return vectors, time.perf_counter() - start
+
+    def _on_success(self, size, elapsed):
+        # 满批次快速成功时将批大小增大1/4（至少加1），不超过上限
+        if size >= self.batch_size and elapsed <= self.target_latency and self.batch_size < self.max_batch_size:
+            self.batch_size = min(self.max_batch_size, self.batch_size + max(1, self.batch_size // 4))
+
+    def _on_too_large(self, size):
+        # 批次过大被拒绝时减半，并把上限降到被拒绝的批大小以下，避免再次增大到该规模
+        self.max_batch_size = max(1, min(self.max_batch_size, size - 1))
+        self.batch_size = max(1, min(self.batch_size, size // 2))
+        logger.info(f"批次过大，批大小调整为{self.batch_size}")
+
+    def embed_with_failures(self, texts):
+        """
+        计算一组文本的向量，并报告无法计算的文本
+
+        Args:
+            texts (list): 文本列表
+
+        Returns:
+            tuple: (向量列表, 失败信息)，向量列表与输入等长且顺序一致，失败的位置为None；
+                   失败信息为 {文本下标: 错误信息}
+        """
+        texts = list(texts)
+        results = [None] * len(texts)
+        failures = {}
+        if not texts:
+            return results, failures
+        start = time.perf_counter()
+        # 待重试的批次 (文本下标列表, 已重试次数)，优先于新批次发出
+        retries = deque()
+        cursor = 0
+        requests = 0
+        in_flight = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while True:
+                # 在途请求不超过max_workers，新批次按当前批大小从剩余文本中切出
+                while len(in_flight) < self.max_workers:
+                    if retries:
+                        indices, attempt = retries.popleft()
+                    elif cursor < len(texts):
+                        indices = list(range(cursor, min(cursor + self.batch_size, len(texts))))
+                        cursor += len(indices)
+                        attempt = 0
+                    else:
+                        break
+                    future = executor.submit(self._embed_batch, [texts[i] for i in indices], attempt)
+                    in_flight[future] = (indices, attempt)
+                    requests += 1
+                if not in_flight:
+                    break
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    indices, attempt = in_flight.pop(future)
+                    error = future.exception()
+                    if error is None:
+                        vectors, elapsed = future.result()
+                        for i, vector in zip(indices, vectors):
+                            results[i] = vector
+                        self._on_success(len(indices), elapsed)
+                        continue
+                    kind = classify_error(error)
+                    if kind == ERROR_TOO_LARGE:
+                        self._on_too_large(len(indices))
+                    if kind == ERROR_TRANSIENT and attempt < self.max_retries:
+                        retries.append((indices, attempt + 1))
+                    elif kind in (ERROR_TOO_LARGE, ERROR_INVALID_INPUT) and len(indices) > 1:
+                        # 拆成两半重试，逐步定位导致失败的文本，其余文本仍可正常计算
+                        middle = len(indices) // 2
+                        retries.appendleft((indices[middle:], 0))
+                        retries.appendleft((indices[:middle], 0))
+                    else:
+                        # 单条文本失败，或错误与输入无关（临时错误重试次数用尽、鉴权失败、模型不存在等），整批记为失败
+                        for i in indices:
+                            failures[i] = str(error)
+                        logger.info(f"{len(indices)}条文本（第{indices[0]}条起）向量计算失败（{kind}）: {error}")
+        logger.info(f"完成{len(texts)}条文本的向量计算，失败{len(failures)}条，共{requests}次请求，"
+                    f"当前批大小{self.batch_size}，耗时{time.perf_counter() - start:.2f}秒")
+        return results, failures
+
+    def embed(self, texts):
+        """
+        计算一组文本的向量
+
+        Args:
+            texts (list): 文本列表
+
+        Returns:
+            list: 向量列表，与输入等长且顺序一致，无法计算的位置为None
+        """
+        return self.embed_with_failures(texts)[0]
@@ -0,0 +1,120 @@
+# 功能说明：PDF逐页解析结果的磁盘缓存，按文件内容哈希及解析参数寻址
+# 每个文件（及解析参数）对应一个gzip压缩的JSON文件，记录各页文本容器的文本；调整切块参数或重复灌库未变化的文件时不再解析PDF
+import os
+import json
+import gzip
+import hashlib
+import logging
+import threading
+
+
+# 设置日志模版
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+# 默认缓存目录
+DEFAULT_CACHE_DIR = "cache/pdf_text"
+
+# 缓存格式版本，解析结果的结构变化时递增，旧缓存自动失效
+_FORMAT_VERSION = 1
+
+# 文件内容哈希按(路径, 大小, 修改时间)在进程内记忆，同一文件不重复计算
+_file_hashes = {}
+_file_hashes_lock = threading.Lock()
+
+
+def file_sha256(filename: str) -> str:
+    """计算文件内容的sha256，按1MB分块读取"""
+    stat = os.stat(filename)
+    key = (os.path.abspath(filename), stat.st_size, stat.st_mtime_ns)
+    with _file_hashes_lock:
+        if key in _file_hashes:
+            return _file_hashes[key]
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    with _file_hashes_lock:
+        _file_hashes[key] = digest.hexdigest()
+    return _file_hashes[key]
+
+
+class ExtractionCache:
+    """
+    PDF逐页解析结果缓存
+
+    缓存条目为 {"pages": {页码: 文本列表}, "page_count": 总页数}，只解析过部分页时只记录这些页，
+    之后解析的其他页合并写入同一条目；page_count在解析过全部页面后记录，用于判断条目是否完整
+    """
+
+    def __init__(self, directory: str = DEFAULT_CACHE_DIR):
+        """
+        Args:
+            directory (str): 缓存目录
+        """
+        self.directory = directory
+        self._lock = threading.Lock()
+        self.hit_pages = 0
+        self.miss_pages = 0
+
+    def _path(self, filename, params):
+        # 解析参数（如解析后端名称）参与寻址，参数不同的解析结果分别缓存
+        params_digest = hashlib.sha256(
+            json.dumps([_FORMAT_VERSION, params], sort_keys=True).encode('utf-8')
+        ).hexdigest()[:16]
+        return os.path.join(self.directory, f"{file_sha256(filename)}-{params_digest}.json.gz")
+
+    def load(self, filename: str, params: dict) -> dict:
+        """
+        读取某一文件的缓存条目
+
+        Args:
+            filename (str): PDF文件路径
+            params (dict): 解析参数
+
+        Returns:
+            dict: {"pages": {页码(int): 文本列表}, "page_count": 总页数或None}，无缓存时pages为空
+        """
+        try:
+            with gzip.open(self._path(filename, params), 'rt', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (FileNotFoundError, OSError, ValueError):
+            return {"pages": {}, "page_count": None}
+        return {"pages": {int(page): texts for page, texts in entry.get("pages", {}).items()},
+                "page_count": entry.get("page_count")}
+
+    def save(self, filename: str, params: dict, pages: dict, page_count: int = None):
+        """
+        将新解析的页合并写入缓存条目；先写临时文件再替换，避免中断时写坏缓存
+
+        Args:
+            filename (str): PDF文件路径
+            params (dict): 解析参数
+            pages (dict): {页码: 文本列表}
+            page_count (int): 总页数，解析过全部页面时传入
+        """
+        if not pages and page_count is None:
+            return
+        with self._lock:
+            entry = self.load(filename, params)
+            entry["pages"].update(pages)
+            if page_count is not None:
+                entry["page_count"] = page_count
+            os.makedirs(self.directory, exist_ok=True)
+            path = self._path(filename, params)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with gzip.open(tmp_path, 'wt', encoding='utf-8', compresslevel=6) as f:
+                json.dump({"pages": {str(page): texts for page, texts in sorted(entry["pages"].items())},
+                           "page_count": entry["page_count"]}, f, ensure_ascii=False, separators=(',', ':'))
+            os.replace(tmp_path, path)
+
+    def record(self, hits: int, misses: int):
+        """累计命中与未命中的页数"""
+        with self._lock:
+            self.hit_pages += hits
+            self.miss_pages += misses
+
+    def stats(self) -> dict:
+        """返回缓存命中的页数统计"""
+        return {"hit_pages": self.hit_pages, "miss_pages": self.miss_pages}
@@ -0,0 +1,114 @@
+# 功能说明：文档相关性评分的快速通道，按检索相关度分数（及可选的字面重合度）直接判定明显相关或明显无关的文档
+# 只有处于模糊区间的文档才交给大模型评分；按抽样比例对快速通道的判定做大模型复核，统计两者不一致的比例
+import random
+import logging
+import threading
+from typing import Optional
+from langchain_core.documents import Document
+from utils.sparse_index import tokenize
+
+
+# 设置日志模版
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def lexical_overlap(question: str, text: str) -> float:
+    """问题的词项（与BM25索引相同的切分方式）在文本中出现的比例"""
+    question_terms = set(tokenize(question))
+    if not question_terms:
+        return 0.0
+    return len(question_terms & set(tokenize(text))) / len(question_terms)
+
+
+class RelevanceGate:
+    """
+    相关性评分快速通道，线程安全
+
+    相关度分数（文档元数据中的relevance_score，余弦相似度）不低于yes_score判为相关，不高于no_score判为无关
+    设置了字面重合度阈值时，重合度不低于lexical_yes判为相关，不高于lexical_no判为无关
+    两种依据的判定冲突，或都落在模糊区间（或缺少依据）时返回None，交给大模型评分
+    """
+
+    def __init__(self, yes_score: Optional[float] = 0.65, no_score: Optional[float] = 0.15,
+                 lexical_yes: Optional[float] = None, lexical_no: Optional[float] = None,
+                 audit_rate: float = 0.05, seed: Optional[int] = None):
+        """
+        Args:
+            yes_score (float): 直接判为相关的最低相关度分数，None表示不按分数判为相关
+            no_score (float): 直接判为无关的最高相关度分数，None表示不按分数判为无关
+            lexical_yes (float): 直接判为相关的最低字面重合度，None表示不使用
+            lexical_no (float): 直接判为无关的最高字面重合度，None表示不使用
+            audit_rate (float): 快速通道判定的文档中，抽样交给大模型复核的比例
+            seed (int): 抽样的随机种子
+        """
+        self.yes_score = yes_score
+        self.no_score = no_score
+        self.lexical_yes = lexical_yes
+        self.lexical_no = lexical_no
+        self.audit_rate = audit_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._counters = {"documents": 0, "gate_yes": 0, "gate_no": 0, "llm_graded": 0, "audited": 0, "disagreements": 0}
+
+    def _by_score(self, score: Optional[float]) -> Optional[str]:
+        if score is None:
+            return None
+        if self.yes_score is not None and score >= self.yes_score:
+            return "yes"
+        if self.no_score is not None and score <= self.no_score:
+            return "no"
+        return None
+
+    def _by_lexical(self, question: str, text: str) -> Optional[str]:
+        if self.lexical_yes is None and self.lexical_no is None:
+            return None
+        overlap = lexical_overlap(question, text)
+        if self.lexical_yes is not None and overlap >= self.lexical_yes:
+            return "yes"
+        if self.lexical_no is not None and overlap <= self.lexical_no:
+            return "no"
+        return None
+
+    def decide(self, question: str, document: Document) -> Optional[str]:
+        """
+        判定文档是否相关
+
+        Returns:
+            str: "yes"或"no"，处于模糊区间时返回None
+        """
+        by_score = self._by_score(document.metadata.get("relevance_score"))
+        by_lexical = self._by_lexical(question, document.page_content)
+        if by_score and by_lexical and by_score != by_lexical:
+            decision = None
+        else:
+            decision = by_score or by_lexical
+        with self._lock:
+            self._counters["documents"] += 1
+            if decision is None:
+                self._counters["llm_graded"] += 1
+            else:
+                self._counters[f"gate_{decision}"] += 1
+        return decision
+
+    def should_audit(self) -> bool:
+        """是否抽中对本次快速通道的判定做大模型复核"""
+        with self._lock:
+            return self._random.random() < self.audit_rate
+
+    def record_audit(self, gate_decision: str, llm_decision: str):
+        """记录一次复核结果"""
+        with self._lock:
+            self._counters["audited"] += 1
+            if gate_decision != llm_decision.lower():
+                self._counters["disagreements"] += 1
+                logger.warning(f"评分快速通道与大模型判定不一致: 快速通道{gate_decision}，大模型{llm_decision}")
+
+    def stats(self) -> dict:
+        """返回计数：文档总数、快速通道判为相关/无关数、大模型评分数、复核数、复核不一致数，以及省去的大模型调用数和不一致率"""
+        with self._lock:
+            stats = dict(self._counters)
+        # 复核的文档仍调用了大模型，不计入省去的调用
+        stats["llm_calls_avoided"] = stats["gate_yes"] + stats["gate_no"] - stats["audited"]
+        stats["disagreement_rate"] = stats["disagreements"] / stats["audited"] if stats["audited"] else 0.0
+        return stats
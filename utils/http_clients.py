@@ -0,0 +1,85 @@
+# 功能说明：长连接复用的HTTP客户端，按服务商复用连接池（keep-alive，支持时启用HTTP/2），并统计新建与复用的连接数
+import logging
+import threading
+import httpx
+
+
+# 设置日志模版
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+# HTTP/2依赖h2包，未安装时退回HTTP/1.1
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class ConnectionStats:
+    """统计HTTP请求数及新建连接数，复用连接数 = 请求数 - 新建连接数，线程安全"""
+
+    def __init__(self):
+        self.requests = 0
+        self.new_connections = 0
+        self._lock = threading.Lock()
+
+    def trace(self, event_name: str, info: dict):
+        """httpcore的trace回调，每建立一条TCP连接或发出一个请求时计数"""
+        if event_name == "connection.connect_tcp.complete":
+            with self._lock:
+                self.new_connections += 1
+        elif event_name in ("http11.send_request_headers.started", "http2.send_request_headers.started"):
+            with self._lock:
+                self.requests += 1
+
+    @property
+    def reused_connections(self) -> int:
+        return max(0, self.requests - self.new_connections)
+
+    def snapshot(self) -> dict:
+        """返回当前统计 {"requests": 请求数, "new_connections": 新建连接数, "reused_connections": 复用连接数}"""
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "new_connections": self.new_connections,
+                "reused_connections": max(0, self.requests - self.new_connections),
+            }
+
+
+def create_http_client(stats: ConnectionStats = None, max_connections: int = 32, max_keepalive_connections: int = 16,
+                       keepalive_expiry: float = 60.0, http2: bool = True, timeout: float = 60.0) -> httpx.Client:
+    """
+    创建带连接池的长连接HTTP客户端
+
+    Args:
+        stats (ConnectionStats): 连接统计，传入时记录新建与复用的连接数
+        max_connections (int): 连接池最大连接数
+        max_keepalive_connections (int): 最多保持的空闲长连接数
+        keepalive_expiry (float): 空闲长连接的保持时间（秒）
+        http2 (bool): 是否启用HTTP/2（需安装h2包，且服务端支持）
+        timeout (float): 请求超时时间（秒）
+
+    Returns:
+        httpx.Client: HTTP客户端，可直接使用，也可作为OpenAI客户端的http_client
+    """
+    if http2 and not HTTP2_AVAILABLE:
+        logger.info("未安装h2包，HTTP客户端使用HTTP/1.1")
+        http2 = False
+    event_hooks = {}
+    if stats is not None:
+        # 在请求发出前挂上trace回调，由httpcore在建立连接、发送请求时调用
+        def attach_trace(request: httpx.Request):
+            request.extensions["trace"] = stats.trace
+        event_hooks["request"] = [attach_trace]
+    return httpx.Client(
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        ),
+        http2=http2,
+        timeout=timeout,
+        event_hooks=event_hooks,
+    )
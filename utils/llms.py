@@ -2,6 +2,9 @@ import os
 import logging
 from dotenv import load_dotenv
 from langchain_openai import ChatOpenAI,OpenAIEmbeddings
+from langchain_core.embeddings import Embeddings
+from utils.config import Config
+from utils.embedding_cache import CachedEmbeddings, get_embedding_cache
 
 # 加载.env文件中的环境变量
 load_dotenv()
@@ -57,7 +60,7 @@ class LLMInitializationError(Exception):
     pass
 
 
-def initialize_llm(llm_type: str = DEFAULT_LLM_TYPE) -> tuple[ChatOpenAI, OpenAIEmbeddings]:
+def initialize_llm(llm_type: str = DEFAULT_LLM_TYPE) -> tuple[ChatOpenAI, Embeddings]:
     """
     初始化LLM实例
 
@@ -65,7 +68,7 @@ def initialize_llm(llm_type: str = DEFAULT_LLM_TYPE) -> tuple[ChatOpenAI, OpenAI
         llm_type (str): LLM类型，可选值为 'openai', 'oneapi', 'qwen', 'ollama', 'singularity'
 
     Returns:
-        ChatOpenAI: 初始化后的LLM实例
+        tuple: 初始化后的Chat模型实例，以及带持久化缓存的Embedding模型实例
 
     Raises:
         LLMInitializationError: 当LLM初始化失败时抛出
@@ -97,6 +100,13 @@ def initialize_llm(llm_type: str = DEFAULT_LLM_TYPE) -> tuple[ChatOpenAI, OpenAI
             model=config["embedding_model"],
             deployment=config["embedding_model"]
         )
+        # 包装持久化向量缓存，重复的查询文本不再调用向量接口
+        llm_embedding = CachedEmbeddings(
+            llm_embedding,
+            get_embedding_cache(Config.EMBEDDING_CACHE_PATH, Config.EMBEDDING_CACHE_MAX_BYTES),
+            provider=llm_type,
+            model=config["embedding_model"]
+        )
 
         logger.info(f"成功初始化 {llm_type} LLM")
         return llm_chat, llm_embedding
@@ -1,7 +1,8 @@
+import os
 import logging
-from pdfminer.high_level import extract_pages
-from pdfminer.layout import LTTextContainer
-import nltk
+from utils import pdf_pipeline
+# 按段落自动检测语言进行断句（language=None），同时支持中文标点和英文标点，中英文混合文档也能正确断句
+from utils.sentence_segmenter import sent_tokenize
 
 
 # 设置日志模版
@@ -9,104 +10,50 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(level
 logger = logging.getLogger(__name__)
 
 
-# 当处理英文文本时，按照该条件进行断句
-from nltk.tokenize import sent_tokenize
-# # 运行后直接下载使用
-# nltk.download('punkt_tab')
-# 也可从本地加载 punk_tab
-nltk.data.path.append('../other/punkt_tab')
+# PDF文档处理函数,从PDF文件中按指定页码提取文字，其返回值为划分段落的文本列表
+# cache_dir：解析结果缓存目录，已缓存的页直接读取，None表示不使用缓存
+# extractor：PDF解析后端，pdfminer（完整版面分析）或 pymupdf（只提取文本，速度快），None表示默认的pdfminer
+def extract_text_from_pdf(filename, page_numbers, min_line_length, cache_dir=None, extractor=None):
+    return pdf_pipeline.extract_paragraphs(filename, page_numbers, min_line_length, cache_dir=cache_dir, extractor=extractor)
 
 
-# PDF文档处理函数,从PDF文件中按指定页码提取文字
-def extract_text_from_pdf(filename, page_numbers, min_line_length):
-    # 申明变量
-    paragraphs = []
-    buffer = ''
-    full_text = ''
-    # 提取全部文本并按照一行一行进行截取，并在每一行后面加上换行符
-    for i, page_layout in enumerate(extract_pages(filename)):
-        # 如果指定了页码范围，跳过范围外的页
-        if page_numbers is not None and i not in page_numbers:
-            continue
-        for element in page_layout:
-            if isinstance(element, LTTextContainer):
-                full_text += element.get_text() + '\n'
-    # full_text：将文件按照一行一行进行截取，并在每一行后面加上换行符
-    # logger.info(f"full_text: {full_text}")
-
-    # 按空行分隔，将文本重新组织成段落
-    # lines：将full_text按照换行符进行切割，此时空行则为空（‘’）
-    lines = full_text.split('\n')
-    # logger.info(f"lines: {lines}")
+# 将PDF文档处理函数得到的文本列表再按一定粒度，部分重叠式的切割文本，使上下文更完整
+# chunk_size：每个文本块的目标大小（以token计），默认为 400
+# overlap_size：块之间的重叠大小（以token计），默认为 100
+# max_tokens：向量模型的输入token上限，任何文本块都不会超过该上限
+def split_text(paragraphs, chunk_size=pdf_pipeline.DEFAULT_CHUNK_TOKENS, overlap_size=pdf_pipeline.DEFAULT_OVERLAP_TOKENS, max_tokens=None):
+    return pdf_pipeline.split_paragraphs(paragraphs, chunk_size, overlap_size, max_tokens, sent_tokenize)
 
-    # 将lines进行循环，取出每一个片段（text）进行处理合并成段落，处理逻辑为：
-    # （1）首先判断text的最小行的长度是否大于min_line_length设置的值
-    # （2）如果大于min_line_length，则将该text拼接在buffer后面，如果该text不是以连字符“-”结尾，则在行前加上一个空格；如果该text是以连字符“-”结尾，则去掉连字符）
-    # （3）如果小于min_line_length且buffer中有内容，则将其添加到 paragraphs 列表中
-    # （4）最后，处理剩余的缓冲区内容，在遍历结束后，如果 buffer 中仍有内容，则将其添加到 paragraphs 列表中
-    for text in lines:
-        if len(text) >= min_line_length:
-            buffer += (' '+text) if not text.endswith('-') else text.strip('-')
-        elif buffer:
-            paragraphs.append(buffer)
-            buffer = ''
-    if buffer:
-        paragraphs.append(buffer)
-    # logger.info(f"paragraphs: {paragraphs[:10]}")
 
-    # 其返回值为划分段落的文本列表
-    return paragraphs
+# 将逐页解析结果 (页码, 文本列表) 流式切分为文本块 {"text": 文本块, "page_start": 起始页码, "page_end": 结束页码}
+# 页面可以来自单进程解析，也可以来自进程池并行解析
+def chunkPages(pages, min_line_length, chunk_size=pdf_pipeline.DEFAULT_CHUNK_TOKENS, overlap_size=pdf_pipeline.DEFAULT_OVERLAP_TOKENS, max_tokens=None):
+    yield from pdf_pipeline.iter_document_chunks(pages, min_line_length, chunk_size, overlap_size, max_tokens, sent_tokenize)
 
 
-# 将PDF文档处理函数得到的文本列表再按一定粒度，部分重叠式的切割文本，使上下文更完整
-# chunk_size：每个文本块的目标大小（以字符为单位），默认为 800
-# overlap_size：块之间的重叠大小（以字符为单位），默认为 200
-def split_text(paragraphs, chunk_size=800, overlap_size=200):
-    # 按指定 chunk_size 和 overlap_size 交叠割文本
-    sentences = [s.strip() for p in paragraphs for s in sent_tokenize(p)]
-    chunks = []
-    i = 0
-    while i < len(sentences):
-        chunk = sentences[i]
-        overlap = ''
-        prev_len = 0
-        prev = i - 1
-        # 向前计算重叠部分
-        while prev >= 0 and len(sentences[prev])+len(overlap) <= overlap_size:
-            overlap = sentences[prev] + ' ' + overlap
-            prev -= 1
-        chunk = overlap+chunk
-        next = i + 1
-        # 向后计算当前chunk
-        while next < len(sentences) and len(sentences[next])+len(chunk) <= chunk_size:
-            chunk = chunk + ' ' + sentences[next]
-            next += 1
-        chunks.append(chunk)
-        i = next
-    # logger.info(f"chunks: {chunks[0:10]}")
-    return chunks
+# 流式处理PDF文档：逐页解析，逐个产出文本块
+# 内存占用与文档大小无关，调用方可以边解析边计算向量
+def iterChunks(filename, page_numbers, min_line_length, chunk_size=pdf_pipeline.DEFAULT_CHUNK_TOKENS, overlap_size=pdf_pipeline.DEFAULT_OVERLAP_TOKENS, max_tokens=None, cache_dir=None, extractor=None):
+    pages = pdf_pipeline.iter_pages(filename, page_numbers, pdf_pipeline.open_extraction_cache(cache_dir), extractor)
+    yield from chunkPages(pages, min_line_length, chunk_size, overlap_size, max_tokens)
 
 
-def getParagraphs(filename, page_numbers, min_line_length):
-    paragraphs = extract_text_from_pdf(filename, page_numbers, min_line_length)
-    chunks = split_text(paragraphs, 800, 200)
-    return chunks
+def getParagraphs(filename, page_numbers, min_line_length, chunk_size=pdf_pipeline.DEFAULT_CHUNK_TOKENS, overlap_size=pdf_pipeline.DEFAULT_OVERLAP_TOKENS, max_tokens=None, cache_dir=None, extractor=None):
+    paragraphs = extract_text_from_pdf(filename, page_numbers, min_line_length, cache_dir=cache_dir, extractor=extractor)
+    return split_text(paragraphs, chunk_size, overlap_size, max_tokens)
 
 
 if __name__ == "__main__":
     # 测试 PDF文档按一定条件处理成文本数据
+    # 在项目根目录下运行：python -m utils.pdfSplitTest_En，输入文件路径相对于项目根目录解析
     paragraphs = getParagraphs(
-        "../input/deepseek-v3-1-4.pdf",
-        # page_numbers=[2, 3],# 指定页面
-        page_numbers=None,#加载全部页面
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "input", "deepseek-v3-1-4.pdf"),
+        # page_numbers=[2, 3], # 指定页面
+        page_numbers=None, # 加载全部页面
         min_line_length=1
     )
-
     # 测试前3条文本
     logger.info(f"只展示3段截取片段:")
     logger.info(f"截取的片段1: {paragraphs[0]}")
     logger.info(f"截取的片段2: {paragraphs[2]}")
     logger.info(f"截取的片段3: {paragraphs[3]}")
-
-
-
@@ -0,0 +1,167 @@
+# 功能说明：可插拔的PDF文本解析后端，统一产出 (页码, 该页文本块列表)，供pdf_pipeline流水线使用
+# pdfminer：完整版面分析，保留LTTextContainer的文本，版面还原度最高，速度较慢（默认）
+# pymupdf：只提取文本块，不做版面分析，速度快一个数量级，需安装pymupdf（pip install pymupdf），未安装时不可用
+import re
+import time
+import difflib
+import logging
+from pdfminer.high_level import extract_pages
+from pdfminer.layout import LTTextContainer
+from pdfminer.pdfpage import PDFPage
+
+try:
+    import pymupdf
+except ImportError:
+    pymupdf = None
+
+
+# 设置日志模版
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+# 默认解析后端
+DEFAULT_EXTRACTOR = "pdfminer"
+
+
+class PdfminerExtractor:
+    """pdfminer解析后端：对选中的页做版面分析，产出各文本容器(LTTextContainer)的文本"""
+
+    name = "pdfminer"
+    # 解析参数，参与解析结果缓存的寻址，解析方式变化时缓存自动失效
+    params = {"extractor": "pdfminer", "laparams": "default"}
+
+    def iter_pages(self, filename, page_numbers=None):
+        if page_numbers is None:
+            layouts = enumerate(extract_pages(filename))
+        else:
+            # 页码筛选下推给pdfminer，范围外的页不做版面分析；pdfminer按文档顺序产出选中的页
+            selected = sorted(set(page_numbers))
+            layouts = zip(selected, extract_pages(filename, page_numbers=set(selected)))
+        for i, page_layout in layouts:
+            yield i, [element.get_text() for element in page_layout if isinstance(element, LTTextContainer)]
+
+    def count_pages(self, filename):
+        # 只解析页面树，不做版面分析
+        with open(filename, 'rb') as fp:
+            return sum(1 for _ in PDFPage.get_pages(fp))
+
+
+class PyMuPDFExtractor:
+    """pymupdf解析后端：按PDF内容流顺序提取文本块，不做版面分析，适合不关心版面还原度的场景"""
+
+    name = "pymupdf"
+    params = {"extractor": "pymupdf", "mode": "blocks"}
+
+    def __init__(self):
+        if pymupdf is None:
+            raise ImportError("pymupdf解析后端需要安装pymupdf: pip install pymupdf")
+
+    def iter_pages(self, filename, page_numbers=None):
+        with pymupdf.open(filename) as document:
+            if page_numbers is None:
+                selected = range(document.page_count)
+            else:
+                selected = [i for i in sorted(set(page_numbers)) if i < document.page_count]
+            for i in selected:
+                # 块的第7项为类型，0为文本块，1为图片块
+                blocks = document[i].get_text("blocks", sort=False)
+                yield i, [block[4] for block in blocks if block[6] == 0]
+
+    def count_pages(self, filename):
+        with pymupdf.open(filename) as document:
+            return document.page_count
+
+
+# 解析后端注册表，新增后端时在此登记
+EXTRACTORS = {
+    PdfminerExtractor.name: PdfminerExtractor,
+    PyMuPDFExtractor.name: PyMuPDFExtractor,
+}
+
+_instances = {}
+
+
+def get_extractor(name=None):
+    """
+    按名称获取解析后端实例，进程内复用
+
+    Args:
+        name (str): 后端名称，None表示默认后端
+
+    Returns:
+        解析后端实例，提供 iter_pages(filename, page_numbers)、count_pages(filename) 及 params
+    """
+    name = name or DEFAULT_EXTRACTOR
+    if name not in _instances:
+        if name not in EXTRACTORS:
+            raise ValueError(f"未知的PDF解析后端: {name}，可选: {list(EXTRACTORS)}")
+        _instances[name] = EXTRACTORS[name]()
+    return _instances[name]
+
+
+def available_extractors():
+    """返回当前环境中可用的解析后端名称（依赖已安装）"""
+    names = []
+    for name in EXTRACTORS:
+        try:
+            get_extractor(name)
+            names.append(name)
+        except ImportError:
+            pass
+    return names
+
+
+_WHITESPACE_PATTERN = re.compile(r'\s+')
+
+
+def compare_pages(reference, candidate):
+    """
+    比较两个后端对同一文件的解析结果
+
+    Returns:
+        dict: {"text_similarity": 去掉空白后全文的相似度(0~1), "identical_pages": 去掉空白后完全一致的页数,
+               "pages": 页数, "blocks": (参照后端文本块数, 对比后端文本块数)}
+    """
+    candidate_pages = dict(candidate)
+    matched = 0
+    total = 0
+    identical = 0
+    for page_number, texts in reference:
+        a = _WHITESPACE_PATTERN.sub('', ''.join(texts))
+        b = _WHITESPACE_PATTERN.sub('', ''.join(candidate_pages.get(page_number, [])))
+        matcher = difflib.SequenceMatcher(None, a, b, autojunk=False)
+        matched += sum(block.size for block in matcher.get_matching_blocks())
+        total += len(a) + len(b)
+        identical += a == b
+    return {
+        "text_similarity": round(2 * matched / total, 4) if total else 1.0,
+        "identical_pages": identical,
+        "pages": len(reference),
+        "blocks": (sum(len(texts) for _, texts in reference), sum(len(texts) for texts in candidate_pages.values())),
+    }
+
+
+if __name__ == "__main__":
+    # 对比各解析后端的速度（页/秒）及与pdfminer解析结果的一致程度（逐页文本相似度、切块后完全一致的文本块数）
+    from utils import pdf_pipeline
+
+    def chunk_texts(pages):
+        return [chunk["text"] for chunk in pdf_pipeline.iter_document_chunks(pages, min_line_length=1)]
+
+    filenames = ["input/健康档案.pdf", "input/deepseek-v3-1-4.pdf"]
+    repeat = 3
+    for filename in filenames:
+        reference = list(get_extractor(PdfminerExtractor.name).iter_pages(filename))
+        reference_chunks = chunk_texts(reference)
+        for name in available_extractors():
+            extractor = get_extractor(name)
+            start = time.perf_counter()
+            for _ in range(repeat):
+                pages = list(extractor.iter_pages(filename))
+            elapsed = (time.perf_counter() - start) / repeat
+            chunks = chunk_texts(pages)
+            same_chunks = len(set(chunks) & set(reference_chunks))
+            logger.info(f"{filename} {name}: {len(pages)}页，耗时{elapsed * 1000:.1f}毫秒，"
+                        f"{len(pages) / elapsed:.1f}页/秒，与pdfminer对比: {compare_pages(reference, pages)}，"
+                        f"文本块{len(chunks)}个（pdfminer {len(reference_chunks)}个，完全一致{same_chunks}个）")
@@ -0,0 +1,368 @@
+# 功能说明：PDF文本的流式处理流水线：页 -> 行 -> 段落 -> 句子 -> 文本块
+# 每一级都是生成器，文本块逐个产出，内存占用与文档大小无关，下游的向量计算可以在解析完成前开始
+# 各级产出的元素都带有页码（从0开始，与page_numbers参数一致），文本块记录其起止页码
+import os
+from collections import deque
+from itertools import groupby
+from concurrent.futures import ProcessPoolExecutor
+from utils.embedding_engine import estimate_tokens
+from utils.pdf_extractors import get_extractor
+from utils.extraction_cache import ExtractionCache, DEFAULT_CACHE_DIR
+from utils.sentence_segmenter import sent_tokenize as default_sent_tokenize
+
+
+# 文本块默认大小及块间重叠大小（以token计）
+DEFAULT_CHUNK_TOKENS = 400
+DEFAULT_OVERLAP_TOKENS = 100
+
+def open_extraction_cache(directory=DEFAULT_CACHE_DIR):
+    """创建解析结果缓存，directory为None时返回None（不使用缓存）"""
+    return ExtractionCache(directory) if directory else None
+
+
+def iter_pages(filename, page_numbers=None, cache=None, extractor=None):
+    """
+    逐页解析PDF，产出每页中文本容器的文本
+
+    Args:
+        filename: PDF文件路径
+        page_numbers: 待处理的页码集合（从0开始），None表示全部页面
+        cache: 解析结果缓存（ExtractionCache），已缓存的页直接读取，只解析未缓存的页并写回缓存
+        extractor: 解析后端名称（见pdf_extractors.EXTRACTORS），None表示默认的pdfminer
+
+    Yields:
+        tuple: (页码, 该页文本容器的文本列表)
+    """
+    if cache is not None:
+        yield from _iter_pages_cached(filename, page_numbers, cache, extractor)
+        return
+    yield from get_extractor(extractor).iter_pages(filename, page_numbers)
+
+
+def _iter_pages_cached(filename, page_numbers, cache, extractor):
+    # 合并缓存中的页与新解析的页，按页码顺序产出；新解析的页在结束（或调用方提前停止）时写回缓存
+    params = get_extractor(extractor).params
+    entry = cache.load(filename, params)
+    cached, page_count = entry["pages"], entry["page_count"]
+    if page_numbers is None:
+        page_count = page_count if page_count is not None else count_pages(filename, extractor)
+        selected = list(range(page_count))
+    else:
+        selected = sorted(set(page_numbers))
+        if page_count is not None:
+            selected = [page for page in selected if page < page_count]
+    missing = [page for page in selected if page not in cached]
+    cache.record(len(selected) - len(missing), len(missing))
+    extracted = iter_pages(filename, missing, extractor=extractor) if missing else iter(())
+    new_pages = {}
+    try:
+        for page in selected:
+            if page in cached:
+                yield page, cached[page]
+                continue
+            # 超出文档范围的页码不会被解析出来，其后也不会再有缓存的页
+            item = next(extracted, None)
+            if item is None:
+                break
+            new_pages[item[0]] = item[1]
+            yield item
+    finally:
+        cache.save(filename, params, new_pages, page_count if page_numbers is None else None)
+
+
+def count_pages(filename, extractor=None):
+    """统计PDF的页数，只解析页面树，不做版面分析"""
+    return get_extractor(extractor).count_pages(filename)
+
+
+def list_pdf_files(path):
+    """path为PDF文件时返回该文件，为目录时返回目录下全部PDF文件（按文件名排序）"""
+    if os.path.isdir(path):
+        return sorted(os.path.join(path, name) for name in os.listdir(path) if name.lower().endswith('.pdf'))
+    return [path]
+
+
+def parse_page_ranges(text):
+    """
+    解析命令行中的页码范围，如 "1-3,7,10-12"，页码从1开始，两端均包含
+
+    Returns:
+        set: 从0开始的页码集合，与page_numbers参数一致
+    """
+    page_numbers = set()
+    for part in text.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        start, _, end = part.partition('-')
+        start = int(start)
+        end = int(end) if end else start
+        if start < 1 or end < start:
+            raise ValueError(f"无效的页码范围: {part}")
+        page_numbers.update(range(start - 1, end))
+    return page_numbers
+
+
+def _extract_page_range(filename, page_numbers, extractor):
+    # 进程池中执行：用指定的解析后端只解析指定页，返回 [(页码, 文本列表)]
+    return list(iter_pages(filename, page_numbers, extractor=extractor))
+
+
+def iter_pages_parallel(filenames, page_numbers=None, max_workers=None, pages_per_task=8, cache=None, extractor=None):
+    """
+    将多个PDF按页码区间切分后分发到进程池并行解析，按文件和页码的原有顺序产出结果
+
+    Args:
+        filenames: PDF文件路径列表
+        page_numbers: 每个文件待处理的页码集合（从0开始），None表示全部页面
+        max_workers: 进程数，None表示CPU核数
+        pages_per_task: 每个任务解析的页数
+        cache: 解析结果缓存（ExtractionCache），已缓存的页不再分发解析，新解析的页按文件写回缓存
+        extractor: 解析后端名称，或根据文件路径返回后端名称的函数（按文件选择后端），None表示默认的pdfminer
+
+    Yields:
+        tuple: (文件路径, 页码, 该页文本容器的文本列表)
+    """
+    extractor_for = extractor if callable(extractor) else (lambda _: extractor)
+    # 各文件使用的解析后端；解析了全部页面的文件记录总页数，写回缓存时一并保存
+    file_extractors = {}
+    page_counts = {}
+
+    def iter_tasks():
+        # 产出 (文件路径, 已缓存的页列表, None) 或 (文件路径, None, 待解析的页码列表)
+        for filename in filenames:
+            file_extractors[filename] = extractor_for(filename)
+            cached, page_count = {}, None
+            if cache is not None:
+                entry = cache.load(filename, get_extractor(file_extractors[filename]).params)
+                cached, page_count = entry["pages"], entry["page_count"]
+            if page_numbers is not None:
+                # 指定了页码时无需统计页数，超出文档范围的页码在解析时自然被忽略
+                selected = sorted(page_numbers)
+                if page_count is not None:
+                    selected = [page for page in selected if page < page_count]
+            else:
+                page_count = page_count if page_count is not None else count_pages(filename, file_extractors[filename])
+                page_counts[filename] = page_count
+                selected = list(range(page_count))
+            if cache is not None:
+                hits = sum(1 for page in selected if page in cached)
+                cache.record(hits, len(selected) - hits)
+            # 连续的已缓存页作为一项直接产出，连续的未缓存页按pages_per_task切分为解析任务
+            for is_cached, group in groupby(selected, key=lambda page: page in cached):
+                group = list(group)
+                if is_cached:
+                    yield filename, [(page, cached[page]) for page in group], None
+                else:
+                    for i in range(0, len(group), pages_per_task):
+                        yield filename, None, group[i:i + pages_per_task]
+
+    # 当前文件新解析的页，切换到下一个文件或全部结束时写回缓存
+    new_pages = {}
+
+    def flush(filename):
+        if cache is not None and filename is not None:
+            cache.save(filename, get_extractor(file_extractors[filename]).params, new_pages, page_counts.get(filename))
+        new_pages.clear()
+
+    max_workers = max_workers or os.cpu_count() or 1
+    # 在途任务数量有上限，下游消费较慢时不会把全部页面的解析结果堆积在内存中
+    window = max_workers * 2
+    current_filename = None
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        pending = deque()
+
+        def drain():
+            nonlocal current_filename
+            done_filename, cached_pages, future = pending.popleft()
+            if done_filename != current_filename:
+                flush(current_filename)
+                current_filename = done_filename
+            if future is None:
+                return done_filename, cached_pages
+            pages = future.result()
+            new_pages.update(pages)
+            return done_filename, pages
+
+        try:
+            for filename, cached_pages, task_pages in iter_tasks():
+                future = (executor.submit(_extract_page_range, filename, task_pages, file_extractors[filename])
+                          if task_pages else None)
+                pending.append((filename, cached_pages, future))
+                if len(pending) >= window:
+                    done_filename, pages = drain()
+                    for page_number, texts in pages:
+                        yield done_filename, page_number, texts
+            while pending:
+                done_filename, pages = drain()
+                for page_number, texts in pages:
+                    yield done_filename, page_number, texts
+        finally:
+            flush(current_filename)
+
+
+def iter_lines(pages):
+    """
+    将逐页的文本拆分为行，每个文本容器之后以一个空行分隔
+
+    Yields:
+        tuple: (页码, 行文本)
+    """
+    for page_number, texts in pages:
+        for text in texts:
+            # 与原先在每个文本容器后追加换行符再整体按换行切分的结果一致
+            for line in (text + '\n').split('\n')[:-1]:
+                yield page_number, line
+
+
+def iter_paragraphs(lines, min_line_length):
+    """
+    按空行（长度小于min_line_length的行）将行合并为段落
+    行不以连字符“-”结尾时在行前加一个空格；以连字符结尾时去掉连字符后直接拼接
+
+    Yields:
+        tuple: (段落首行所在页码, 段落文本)
+    """
+    buffer = []
+    start_page = None
+    for page_number, text in lines:
+        if len(text) >= min_line_length:
+            if not buffer:
+                start_page = page_number
+            buffer.append((' ' + text) if not text.endswith('-') else text.strip('-'))
+        elif buffer:
+            yield start_page, ''.join(buffer)
+            buffer = []
+    if buffer:
+        yield start_page, ''.join(buffer)
+
+
+def iter_sentences(paragraphs, sent_tokenize):
+    """
+    将段落按sent_tokenize断句，去掉句子首尾空白
+
+    Yields:
+        tuple: (页码, 句子)
+    """
+    for page_number, paragraph in paragraphs:
+        for sentence in sent_tokenize(paragraph):
+            yield page_number, sentence.strip()
+
+
+def _split_long_sentence(sentence, tokens, limit, count_tokens):
+    # 超过单块token上限的句子按估算比例切成若干段，尽量在空白处切分，保证每段都不超过上限
+    while tokens > limit:
+        cut = max(1, len(sentence) * limit // tokens)
+        space = sentence.rfind(' ', cut // 2, cut)
+        if space > 0:
+            cut = space
+        piece = sentence[:cut].strip()
+        piece_tokens = count_tokens(piece)
+        # 估算比例偏大时逐步缩短，直到该段不超过上限
+        while piece_tokens > limit and cut > 1:
+            cut = max(1, cut * limit // piece_tokens)
+            piece = sentence[:cut].strip()
+            piece_tokens = count_tokens(piece)
+        if piece:
+            yield piece, piece_tokens
+        sentence = sentence[cut:].strip()
+        tokens = count_tokens(sentence)
+    if sentence:
+        yield sentence, tokens
+
+
+def iter_chunks(sentences, chunk_size=DEFAULT_CHUNK_TOKENS, overlap_size=DEFAULT_OVERLAP_TOKENS,
+                max_tokens=None, count_tokens=estimate_tokens):
+    """
+    将句子按一定粒度部分重叠式地组合成文本块，使上下文更完整，大小以token计
+    每个句子的token数只计算一次，重叠部分从上一个文本块的末尾取，整体耗时与文档大小成线性关系
+
+    Args:
+        sentences: (页码, 句子) 的可迭代对象
+        chunk_size: 每个文本块的目标token数
+        overlap_size: 块之间重叠的token数
+        max_tokens: 向量模型的输入token上限，任何文本块都不会超过该上限，None表示只按chunk_size限制
+        count_tokens: token计数函数
+
+    Yields:
+        dict: {"text": 文本块, "page_start": 起始页码, "page_end": 结束页码}
+    """
+    limit = min(chunk_size, max_tokens) if max_tokens else chunk_size
+    # 当前文本块中的句子 (页码, 句子, token数)，以及其中是否有重叠部分之外的新句子
+    current = []
+    current_tokens = 0
+    has_new = False
+    for page_number, sentence in sentences:
+        for piece, tokens in _split_long_sentence(sentence, count_tokens(sentence), limit, count_tokens):
+            if has_new and current_tokens + tokens > limit:
+                yield {"text": ' '.join(item[1] for item in current),
+                       "page_start": current[0][0], "page_end": current[-1][0]}
+                # 从上一个文本块末尾向前取重叠部分，并保证重叠部分加上当前句子不超过上限
+                budget = min(overlap_size, limit - tokens)
+                overlap = []
+                overlap_tokens = 0
+                for item in reversed(current):
+                    if overlap_tokens + item[2] > budget:
+                        break
+                    overlap.append(item)
+                    overlap_tokens += item[2]
+                overlap.reverse()
+                current = overlap
+                current_tokens = overlap_tokens
+            current.append((page_number, piece, tokens))
+            current_tokens += tokens
+            has_new = True
+    if has_new:
+        yield {"text": ' '.join(item[1] for item in current),
+               "page_start": current[0][0], "page_end": current[-1][0]}
+
+
+def iter_document_chunks(pages, min_line_length, chunk_size=DEFAULT_CHUNK_TOKENS, overlap_size=DEFAULT_OVERLAP_TOKENS,
+                         max_tokens=None, sent_tokenize=default_sent_tokenize):
+    """
+    将逐页解析结果 (页码, 文本列表) 依次经过行、段落、句子各级处理，流式切分为文本块
+    默认按段落自动检测语言断句，中英文混合文档无需指定语言
+
+    Yields:
+        dict: {"text": 文本块, "page_start": 起始页码, "page_end": 结束页码}
+    """
+    paragraphs = iter_paragraphs(iter_lines(pages), min_line_length)
+    sentences = iter_sentences(paragraphs, sent_tokenize)
+    yield from iter_chunks(sentences, chunk_size, overlap_size, max_tokens)
+
+
+def extract_paragraphs(filename, page_numbers, min_line_length, cache_dir=DEFAULT_CACHE_DIR, extractor=None):
+    """
+    从PDF文件中按指定页码提取文字，按空行合并为段落
+
+    Args:
+        filename: PDF文件路径
+        page_numbers: 待处理的页码集合（从0开始），None表示全部页面
+        min_line_length: 长度小于该值的行视为空行
+        cache_dir: 解析结果缓存目录，None表示不使用缓存
+        extractor: 解析后端名称，None表示默认的pdfminer
+
+    Returns:
+        list: 段落文本列表
+    """
+    pages = iter_pages(filename, page_numbers, open_extraction_cache(cache_dir), extractor)
+    return [paragraph for _, paragraph in iter_paragraphs(iter_lines(pages), min_line_length)]
+
+
+def split_paragraphs(paragraphs, chunk_size=DEFAULT_CHUNK_TOKENS, overlap_size=DEFAULT_OVERLAP_TOKENS,
+                     max_tokens=None, sent_tokenize=default_sent_tokenize):
+    """
+    将段落文本列表断句后，按token部分重叠式地切分为文本块（与灌库使用同一切块逻辑iter_chunks）
+
+    Args:
+        paragraphs: 段落文本列表
+        chunk_size: 每个文本块的目标token数
+        overlap_size: 块之间重叠的token数
+        max_tokens: 向量模型的输入token上限，任何文本块都不会超过该上限，None表示只按chunk_size限制
+        sent_tokenize: 断句函数
+
+    Returns:
+        list: 文本块列表
+    """
+    sentences = iter_sentences(((None, paragraph) for paragraph in paragraphs), sent_tokenize)
+    return [chunk["text"] for chunk in iter_chunks(sentences, chunk_size, overlap_size, max_tokens)]
@@ -0,0 +1,496 @@
+# 功能说明：基于PostgreSQL pgvector扩展的向量存储，可替代本地chromaDB目录作为检索后端
+# 文本块及其向量存储在数据库表中（每个集合一张表），检索使用HNSW余弦距离索引，m、ef_construction、ef_search均可配置
+# 多个API服务实例共用同一数据库，不再各自持有一份本地向量库，灌库只需写入一次
+# 同时提供存储在数据库中的BM25稀疏索引和知识库版本号，多个API服务实例共用，混合检索及语义答案缓存失效不依赖本地文件
+# 直接运行本文件可将已有的chromaDB集合迁移到pgvector：python -m utils.pgvector_store --collection demo001
+import re
+import json
+import hashlib
+import logging
+import argparse
+import threading
+from collections import Counter
+from typing import Any, Callable, Iterable, List, Optional, Tuple
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+from psycopg.types.json import Jsonb
+from psycopg_pool import ConnectionPool
+from utils.sparse_index import tokenize
+from utils.corpus_version import INITIAL_VERSION, new_corpus_version
+
+
+# 设置日志模版
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+# 表名前缀，集合demo001对应的表为rag_chunks_demo001，BM25稀疏索引的表为rag_bm25_docs_demo001及rag_bm25_postings_demo001
+TABLE_PREFIX = "rag_chunks"
+SPARSE_TABLE_PREFIX = "rag_bm25"
+# 知识库版本号表，每个集合一行
+CORPUS_VERSION_TABLE = "rag_corpus_version"
+# 集合名称只允许字母、数字和下划线，用于拼接表名
+_COLLECTION_NAME_PATTERN = re.compile(r'^[A-Za-z0-9_]+$')
+
+
+def _vector_literal(vector) -> str:
+    # pgvector的文本表示，配合 ::vector 类型转换使用，无需额外安装pgvector的Python包
+    return '[' + ','.join(repr(float(x)) for x in vector) + ']'
+
+
+def create_connection_pool(conninfo: str, max_size: int = 10) -> ConnectionPool:
+    """创建自动提交的数据库连接池，连接参数与API服务的连接池一致"""
+    return ConnectionPool(
+        conninfo=conninfo,
+        min_size=1,
+        max_size=max_size,
+        kwargs={"autocommit": True, "prepare_threshold": 0, "connect_timeout": 5},
+        timeout=10,
+        open=True,
+    )
+
+
+# 同一连接串的连接池在进程内共享一个实例
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_connection_pool(conninfo: str, max_size: int = 10) -> ConnectionPool:
+    """获取指定连接串的连接池，同一进程内复用，进程退出前调用close_connection_pools关闭"""
+    with _pools_lock:
+        pool = _pools.get(conninfo)
+        if pool is None or pool.closed:
+            pool = _pools[conninfo] = create_connection_pool(conninfo, max_size)
+        return pool
+
+
+def close_connection_pools():
+    """关闭进程内共享的全部连接池，API服务关闭或灌库结束时调用"""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        if not pool.closed:
+            pool.close()
+    if pools:
+        logger.info(f"已关闭{len(pools)}个pgvector连接池")
+
+
+class PGVectorStore(VectorStore):
+    """
+    pgvector向量存储，线程安全
+
+    文档以与chromaDB相同的ID存储（含文本、元数据和向量），表首次写入时按向量维度创建
+    检索结果的距离为余弦距离（0表示方向相同），相关度分数为 1 - 余弦距离
+    """
+
+    def __init__(self, connection_pool: ConnectionPool, collection_name: str, embedding: Optional[Embeddings] = None,
+                 hnsw_m: int = 16, hnsw_ef_construction: int = 64, ef_search: int = 40):
+        """
+        Args:
+            connection_pool (ConnectionPool): 数据库连接池（需自动提交）
+            collection_name (str): 集合名称，对应表名 rag_chunks_<集合名称>
+            embedding (Embeddings): 计算查询向量的模型实例，只写入不检索时可为None
+            hnsw_m (int): HNSW索引每个节点的最大连接数，越大召回率越高、索引越大
+            hnsw_ef_construction (int): HNSW建索引时的候选列表大小，越大索引质量越高、建索引越慢
+            ef_search (int): HNSW检索时的候选列表大小，越大召回率越高、检索越慢，实际取值不小于返回的文档数
+        """
+        if not _COLLECTION_NAME_PATTERN.match(collection_name):
+            raise ValueError(f"集合名称只能包含字母、数字和下划线: {collection_name}")
+        self.connection_pool = connection_pool
+        self.collection_name = collection_name
+        self.table = f"{TABLE_PREFIX}_{collection_name.lower()}"
+        self.embedding = embedding
+        self.hnsw_m = hnsw_m
+        self.hnsw_ef_construction = hnsw_ef_construction
+        self.ef_search = ef_search
+        self._table_ready = False
+        self._lock = threading.Lock()
+
+    @property
+    def embeddings(self) -> Optional[Embeddings]:
+        return self.embedding
+
+    def _table_exists(self, cur) -> bool:
+        cur.execute("SELECT to_regclass(%s)", (self.table,))
+        return cur.fetchone()[0] is not None
+
+    def setup(self, dims: int):
+        """创建pgvector扩展、集合表及HNSW索引，表已存在时不做修改"""
+        with self._lock:
+            if self._table_ready:
+                return
+            with self.connection_pool.connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("CREATE EXTENSION IF NOT EXISTS vector")
+                    cur.execute(f"""
+                        CREATE TABLE IF NOT EXISTS {self.table} (
+                            id TEXT PRIMARY KEY,
+                            document TEXT NOT NULL,
+                            metadata JSONB NOT NULL DEFAULT '{{}}'::jsonb,
+                            embedding vector({int(dims)}) NOT NULL
+                        )
+                    """)
+                    cur.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_source_idx ON {self.table} ((metadata->>'source'))")
+                    cur.execute(f"""
+                        CREATE INDEX IF NOT EXISTS {self.table}_embedding_idx ON {self.table}
+                        USING hnsw (embedding vector_cosine_ops)
+                        WITH (m = {int(self.hnsw_m)}, ef_construction = {int(self.hnsw_ef_construction)})
+                    """)
+            self._table_ready = True
+            logger.info(f"pgvector表{self.table}已就绪，向量维度{dims}，HNSW参数 m={self.hnsw_m} "
+                        f"ef_construction={self.hnsw_ef_construction}")
+
+    def _ready(self, cur) -> bool:
+        # 表尚未创建（从未灌库）时，读操作直接返回空结果
+        if not self._table_ready and self._table_exists(cur):
+            self._table_ready = True
+        return self._table_ready
+
+    def upsert(self, ids: List[str], documents: List[str], metadatas: List[dict], embeddings: List[List[float]]):
+        """按ID写入文档，已存在的文档被覆盖；参数名与chromaDB集合的upsert一致"""
+        if not ids:
+            return
+        self.setup(len(embeddings[0]))
+        rows = [(doc_id, document, json.dumps(metadata or {}, ensure_ascii=False), _vector_literal(vector))
+                for doc_id, document, metadata, vector in zip(ids, documents, metadatas, embeddings)]
+        with self.connection_pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.executemany(f"""
+                    INSERT INTO {self.table} (id, document, metadata, embedding)
+                    VALUES (%s, %s, %s::jsonb, %s::vector)
+                    ON CONFLICT (id) DO UPDATE
+                    SET document = EXCLUDED.document, metadata = EXCLUDED.metadata, embedding = EXCLUDED.embedding
+                """, rows)
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        """按ID删除文档"""
+        if not ids:
+            return None
+        with self.connection_pool.connection() as conn:
+            with conn.cursor() as cur:
+                if self._ready(cur):
+                    cur.execute(f"DELETE FROM {self.table} WHERE id = ANY(%s)", (list(ids),))
+        return True
+
+    def existing_ids(self, ids: List[str]) -> set:
+        """返回ids中已写入的ID"""
+        if not ids:
+            return set()
+        with self.connection_pool.connection() as conn:
+            with conn.cursor() as cur:
+                if not self._ready(cur):
+                    return set()
+                cur.execute(f"SELECT id FROM {self.table} WHERE id = ANY(%s)", (list(ids),))
+                return {row[0] for row in cur.fetchall()}
+
+    def source_ids(self, source: str, page_numbers: Optional[Iterable[int]] = None) -> set:
+        """返回某一来源的全部文档ID，传入page_numbers时只返回起始页在这些页中的文档"""
+        with self.connection_pool.connection() as conn:
+            with conn.cursor() as cur:
+                if not self._ready(cur):
+                    return set()
+                if page_numbers is None:
+                    cur.execute(f"SELECT id FROM {self.table} WHERE metadata->>'source' = %s", (source,))
+                else:
+                    cur.execute(f"""
+                        SELECT id FROM {self.table}
+                        WHERE metadata->>'source' = %s AND (metadata->>'page_start')::int = ANY(%s)
+                    """, (source, sorted(page_numbers)))
+                return {row[0] for row in cur.fetchall()}
+
+    def sources(self) -> set:
+        """返回集合中全部文档的来源"""
+        with self.connection_pool.connection() as conn:
+            with conn.cursor() as cur:
+                if not self._ready(cur):
+                    return set()
+                cur.execute(f"SELECT DISTINCT metadata->>'source' FROM {self.table}")
+                return {row[0] for row in cur.fetchall() if row[0] is not None}
+
+    def count(self) -> int:
+        """返回集合中的文档数量"""
+        with self.connection_pool.connection() as conn:
+            with conn.cursor() as cur:
+                if not self._ready(cur):
+                    return 0
+                cur.execute(f"SELECT COUNT(*) FROM {self.table}")
+                return cur.fetchone()[0]
+
+    def similarity_search_by_vector_with_score(self, embedding: List[float], k: int = 4) -> List[Tuple[Document, float]]:
+        """
+        按查询向量检索最相似的文档
+
+        Returns:
+            list: [(文档, 余弦距离)]，按距离从小到大排列
+        """
+        vector = _vector_literal(embedding)
+        with self.connection_pool.connection() as conn:
+            with conn.cursor() as cur:
+                if not self._ready(cur):
+                    return []
+                # ef_search只在当前事务内生效，不影响连接池中其他使用者
+                with conn.transaction():
+                    cur.execute(f"SET LOCAL hnsw.ef_search = {int(max(self.ef_search, k))}")
+                    cur.execute(f"""
+                        SELECT id, document, metadata, embedding <=> %s::vector AS distance
+                        FROM {self.table}
+                        ORDER BY embedding <=> %s::vector
+                        LIMIT %s
+                    """, (vector, vector, k))
+                    rows = cur.fetchall()
+        return [(Document(page_content=document, metadata=metadata, id=doc_id), distance)
+                for doc_id, document, metadata, distance in rows]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        """按查询文本检索最相似的文档，返回 [(文档, 余弦距离)]"""
+        return self.similarity_search_by_vector_with_score(self.embedding.embed_query(query), k)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [document for document, _ in self.similarity_search_with_score(query, k)]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return [document for document, _ in self.similarity_search_by_vector_with_score(embedding, k)]
+
+    def _select_relevance_score_fn(self) -> Callable[[float], float]:
+        # 余弦距离转换为相关度分数
+        return lambda distance: 1.0 - distance
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None,
+                  ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        """计算文本的向量并写入，未指定ID时按文本内容哈希生成"""
+        texts = list(texts)
+        if ids is None:
+            ids = [hashlib.sha256(text.encode('utf-8')).hexdigest() for text in texts]
+        metadatas = metadatas or [{}] * len(texts)
+        self.upsert(ids=ids, documents=texts, metadatas=metadatas, embeddings=self.embedding.embed_documents(texts))
+        return ids
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None, *,
+                   connection_pool: ConnectionPool = None, collection_name: str = "default",
+                   ids: Optional[List[str]] = None, **kwargs: Any) -> "PGVectorStore":
+        store = cls(connection_pool, collection_name, embedding, **kwargs)
+        store.add_texts(texts, metadatas, ids)
+        return store
+
+
+class PGSparseIndex:
+    """
+    存储在PostgreSQL中的BM25稀疏索引，接口与SparseIndex一致，线程安全
+
+    词项切分与SparseIndex相同，BM25分数在数据库中按查询词项的倒排记录计算，不在进程内加载索引
+    """
+
+    def __init__(self, connection_pool: ConnectionPool, collection_name: str, k1: float = 1.5, b: float = 0.75):
+        """
+        Args:
+            connection_pool (ConnectionPool): 数据库连接池（需自动提交）
+            collection_name (str): 集合名称，对应表名 rag_bm25_docs_<集合名称> 及 rag_bm25_postings_<集合名称>
+            k1 (float): BM25词频饱和参数
+            b (float): BM25文档长度归一化参数
+        """
+        if not _COLLECTION_NAME_PATTERN.match(collection_name):
+            raise ValueError(f"集合名称只能包含字母、数字和下划线: {collection_name}")
+        self.connection_pool = connection_pool
+        self.documents_table = f"{SPARSE_TABLE_PREFIX}_docs_{collection_name.lower()}"
+        self.postings_table = f"{SPARSE_TABLE_PREFIX}_postings_{collection_name.lower()}"
+        self.k1 = k1
+        self.b = b
+        with self.connection_pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(f"""
+                    CREATE TABLE IF NOT EXISTS {self.documents_table} (
+                        id TEXT PRIMARY KEY,
+                        text TEXT NOT NULL,
+                        metadata JSONB NOT NULL DEFAULT '{{}}'::jsonb,
+                        length INTEGER NOT NULL
+                    )
+                """)
+                cur.execute(f"""
+                    CREATE TABLE IF NOT EXISTS {self.postings_table} (
+                        term TEXT NOT NULL,
+                        id TEXT NOT NULL,
+                        tf INTEGER NOT NULL,
+                        PRIMARY KEY (term, id)
+                    )
+                """)
+                cur.execute(f"CREATE INDEX IF NOT EXISTS {self.postings_table}_id_idx ON {self.postings_table} (id)")
+
+    def add_documents(self, ids: list, texts: list, metadatas: list = None):
+        """按ID写入文档，已存在的文档被覆盖"""
+        if not ids:
+            return
+        metadatas = metadatas or [{}] * len(ids)
+        rows = []
+        postings = []
+        for doc_id, text, metadata in zip(ids, texts, metadatas):
+            counts = Counter(tokenize(text))
+            rows.append((doc_id, text, Jsonb(metadata or {}), sum(counts.values())))
+            postings.extend((term, doc_id, tf) for term, tf in counts.items())
+        with self.connection_pool.connection() as conn:
+            with conn.transaction():
+                with conn.cursor() as cur:
+                    self._delete(cur, ids)
+                    cur.executemany(f"INSERT INTO {self.documents_table} (id, text, metadata, length) VALUES (%s, %s, %s, %s)", rows)
+                    cur.executemany(f"INSERT INTO {self.postings_table} (term, id, tf) VALUES (%s, %s, %s)", postings)
+
+    def delete(self, ids: list):
+        """按ID删除文档"""
+        if not ids:
+            return
+        with self.connection_pool.connection() as conn:
+            with conn.transaction():
+                with conn.cursor() as cur:
+                    self._delete(cur, ids)
+
+    def _delete(self, cur, ids):
+        cur.execute(f"DELETE FROM {self.documents_table} WHERE id = ANY(%s)", (list(ids),))
+        cur.execute(f"DELETE FROM {self.postings_table} WHERE id = ANY(%s)", (list(ids),))
+
+    def missing_ids(self, ids: list) -> set:
+        """返回ids中尚未写入索引的ID，用于为已有的向量集合补建索引"""
+        if not ids:
+            return set()
+        with self.connection_pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(f"SELECT id FROM {self.documents_table} WHERE id = ANY(%s)", (list(ids),))
+                return set(ids) - {row[0] for row in cur.fetchall()}
+
+    def count(self) -> int:
+        """返回索引中的文档数量"""
+        with self.connection_pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(f"SELECT COUNT(*) FROM {self.documents_table}")
+                return cur.fetchone()[0]
+
+    def search(self, query: str, k: int = 10) -> list:
+        """
+        按BM25分数检索文档
+
+        Args:
+            query (str): 查询文本
+            k (int): 返回的文档数量
+
+        Returns:
+            list: [(文档ID, 文本, 元数据, BM25分数)]，按分数从高到低排列
+        """
+        query_terms = Counter(tokenize(query))
+        if not query_terms:
+            return []
+        with self.connection_pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(f"""
+                    WITH q AS (SELECT * FROM unnest(%s::text[], %s::int[]) AS q(term, query_tf)),
+                    stats AS (SELECT COUNT(*) AS n, AVG(length) AS average_length FROM {self.documents_table}),
+                    df AS (SELECT p.term, COUNT(*) AS df FROM {self.postings_table} p JOIN q USING (term) GROUP BY p.term),
+                    scores AS (
+                        SELECT p.id, SUM(
+                            q.query_tf * ln(1 + (stats.n - df.df + 0.5) / (df.df + 0.5))
+                            * p.tf * (%s + 1) / (p.tf + %s * (1 - %s + %s * d.length / stats.average_length))
+                        ) AS score
+                        FROM {self.postings_table} p
+                        JOIN q USING (term)
+                        JOIN df USING (term)
+                        JOIN {self.documents_table} d ON d.id = p.id
+                        CROSS JOIN stats
+                        GROUP BY p.id
+                        ORDER BY score DESC
+                        LIMIT %s
+                    )
+                    SELECT s.id, d.text, d.metadata, s.score
+                    FROM scores s JOIN {self.documents_table} d ON d.id = s.id
+                    ORDER BY s.score DESC
+                """, (list(query_terms.keys()), list(query_terms.values()), self.k1, self.k1, self.b, self.b, k))
+                return [(row[0], row[1], row[2], float(row[3])) for row in cur.fetchall()]
+
+
+class PGCorpusVersion:
+    """知识库版本号存储在PostgreSQL中（每个集合一行），灌库脚本与各API服务实例可以部署在不同机器上"""
+
+    def __init__(self, connection_pool: ConnectionPool, collection_name: str):
+        self.connection_pool = connection_pool
+        self.collection_name = collection_name
+        with self.connection_pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(f"""
+                    CREATE TABLE IF NOT EXISTS {CORPUS_VERSION_TABLE} (
+                        collection TEXT PRIMARY KEY,
+                        version TEXT NOT NULL,
+                        updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+                    )
+                """)
+
+    def read(self) -> str:
+        """读取知识库版本号，从未灌库时返回INITIAL_VERSION"""
+        with self.connection_pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(f"SELECT version FROM {CORPUS_VERSION_TABLE} WHERE collection = %s", (self.collection_name,))
+                row = cur.fetchone()
+        return row[0] if row else INITIAL_VERSION
+
+    def bump(self) -> str:
+        """生成并写入新的知识库版本号"""
+        version = new_corpus_version()
+        with self.connection_pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(f"""
+                    INSERT INTO {CORPUS_VERSION_TABLE} (collection, version) VALUES (%s, %s)
+                    ON CONFLICT (collection) DO UPDATE SET version = EXCLUDED.version, updated_at = CURRENT_TIMESTAMP
+                """, (self.collection_name, version))
+        logger.info(f"知识库版本号更新为: {version}")
+        return version
+
+
+def migrate_from_chroma(chroma_directory: str, collection_name: str, store: PGVectorStore, batch_size: int = 500,
+                        sparse_index: Optional[PGSparseIndex] = None) -> int:
+    """
+    将chromaDB集合中的文档（ID、文本、元数据、向量）原样复制到pgvector，不重新计算向量
+
+    Args:
+        chroma_directory (str): chromaDB持久化目录
+        collection_name (str): chromaDB集合名称
+        store (PGVectorStore): 目标pgvector存储
+        batch_size (int): 每批读取及写入的文档数量
+        sparse_index (PGSparseIndex): 传入时同时写入数据库中的BM25稀疏索引
+
+    Returns:
+        int: 迁移的文档数量
+    """
+    import chromadb
+    collection = chromadb.PersistentClient(path=chroma_directory).get_collection(collection_name)
+    total = collection.count()
+    migrated = 0
+    while migrated < total:
+        result = collection.get(include=["documents", "metadatas", "embeddings"], limit=batch_size, offset=migrated)
+        if not result["ids"]:
+            break
+        store.upsert(ids=result["ids"], documents=result["documents"],
+                     metadatas=[metadata or {} for metadata in result["metadatas"]],
+                     embeddings=[list(vector) for vector in result["embeddings"]])
+        if sparse_index is not None:
+            sparse_index.add_documents(result["ids"], result["documents"],
+                                       [metadata or {} for metadata in result["metadatas"]])
+        migrated += len(result["ids"])
+        logger.info(f"已迁移 {migrated}/{total} 条")
+    return migrated
+
+
+if __name__ == "__main__":
+    from utils.config import Config
+    parser = argparse.ArgumentParser(description="将chromaDB集合迁移到pgvector")
+    parser.add_argument("--chroma-dir", default=Config.CHROMADB_DIRECTORY, help="chromaDB持久化目录")
+    parser.add_argument("--collection", default=Config.CHROMADB_COLLECTION_NAME, help="集合名称")
+    parser.add_argument("--db-uri", default=Config.PGVECTOR_DB_URI, help="PostgreSQL连接串")
+    parser.add_argument("--batch-size", type=int, default=500, help="每批迁移的文档数量")
+    args = parser.parse_args()
+    pool = create_connection_pool(args.db_uri)
+    target = PGVectorStore(pool, args.collection, hnsw_m=Config.PGVECTOR_HNSW_M,
+                           hnsw_ef_construction=Config.PGVECTOR_HNSW_EF_CONSTRUCTION)
+    count = migrate_from_chroma(args.chroma_dir, args.collection, target, args.batch_size,
+                                PGSparseIndex(pool, args.collection) if Config.HYBRID_SEARCH else None)
+    # 迁移后的内容视为新版本，各API服务实例的语义答案缓存随之失效
+    PGCorpusVersion(pool, args.collection).bump()
+    logger.info(f"迁移完成: chromaDB集合{args.collection}共{count}条 -> pgvector表{target.table}（现有{target.count()}条）")
+    pool.close()
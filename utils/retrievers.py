@@ -0,0 +1,260 @@
+# 功能说明：混合检索器，将向量检索与BM25稀疏检索的结果按倒数排名融合(RRF)
+# 向量检索擅长语义匹配，BM25擅长人名、编号、数值等精确字面匹配，融合后首轮检索的召回率更高，减少问题改写的轮次
+# 以及按相关度分数筛选文档的自适应检索器：相关度阈值、按分数分布自适应返回数量、返回内容的token预算
+# 以及上下文去重检索器：合并同一来源中首尾重叠的文本块，去掉重复的句子
+import asyncio
+import logging
+from typing import Any, Callable, List, Optional
+from pydantic import ConfigDict
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from utils.embedding_engine import estimate_tokens
+from utils.context_merge import deduplicate_context
+
+
+# 设置日志模版
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], rrf_k: int = 60) -> List[tuple]:
+    """
+    倒数排名融合：文档的融合分数为其在各排名列表中 1 / (rrf_k + 名次) 之和，名次从1开始
+
+    Args:
+        rankings (list): 多个按相关度排好序的文档ID列表
+        rrf_k (int): 平滑常数，越大则各列表靠前名次之间的差距越小
+
+    Returns:
+        list: [(文档ID, 融合分数)]，按分数从高到低排列
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (rrf_k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+def apply_token_budget(documents: List[Document], max_tokens: Optional[int]) -> tuple:
+    """
+    按排名依次保留文档，文档内容的估算token数累计不超过max_tokens，排名第一的文档超出预算时按比例截断
+
+    Args:
+        documents (list): 按相关度排好序的文档
+        max_tokens (int): token预算，None表示不限制
+
+    Returns:
+        tuple: (保留的文档列表, 估算的token数)
+    """
+    results = []
+    used_tokens = 0
+    for document in documents:
+        tokens = estimate_tokens(document.page_content)
+        if max_tokens is not None and used_tokens + tokens > max_tokens:
+            if results:
+                break
+            keep = max(1, len(document.page_content) * max_tokens // tokens)
+            document = Document(page_content=document.page_content[:keep], metadata=document.metadata, id=document.id)
+            tokens = estimate_tokens(document.page_content)
+        results.append(document)
+        used_tokens += tokens
+    return results, used_tokens
+
+
+def _relevance(document: Document) -> float:
+    # 文档的相关度分数，没有时视为最低
+    score = document.metadata.get("relevance_score")
+    return float("-inf") if score is None else score
+
+
+def fuse_documents(rankings: List[List[Document]], k: int, rrf_k: int = 60) -> List[Document]:
+    """
+    将多次检索的文档列表按RRF融合，返回前k个文档，元数据中记录融合分数rrf_score，相关度分数取各次检索中的最高值
+
+    Args:
+        rankings (list): 多个按相关度排好序的文档列表
+        k (int): 返回的文档数量
+        rrf_k (int): RRF平滑常数
+
+    Returns:
+        list: 融合后的文档
+    """
+    documents = {}
+    id_rankings = []
+    for ranking in rankings:
+        ids = []
+        for document in ranking:
+            # 没有ID的文档按内容去重
+            doc_id = document.id or document.page_content
+            if doc_id in ids:
+                continue
+            ids.append(doc_id)
+            known = documents.get(doc_id)
+            if known is None or _relevance(document) > _relevance(known):
+                documents[doc_id] = document
+        id_rankings.append(ids)
+    return [Document(page_content=documents[doc_id].page_content,
+                     metadata=dict(documents[doc_id].metadata, rrf_score=score), id=documents[doc_id].id)
+            for doc_id, score in reciprocal_rank_fusion(id_rankings, rrf_k)[:k]]
+
+
+def cosine_similarity_fn(vectorstore: Any) -> Callable[[float], float]:
+    """
+    返回将向量检索距离换算为余弦相似度的函数，作为文档的相关度分数，两种检索后端的分数在同一尺度上，阈值配置通用
+
+    Chroma集合按创建时的hnsw:space返回距离：cosine及ip为1-余弦相似度（ip要求向量已归一化），
+    l2（未指定时的默认值）为L2距离的平方，向量已归一化时等于2-2×余弦相似度；
+    其他向量存储（pgvector返回余弦距离）使用其自身的相关度分数函数
+    """
+    collection = getattr(vectorstore, "_collection", None)
+    if collection is None:
+        return vectorstore._select_relevance_score_fn()
+    space = (collection.metadata or {}).get("hnsw:space", "l2")
+    if space == "l2":
+        return lambda distance: 1.0 - distance / 2.0
+    return lambda distance: 1.0 - distance
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    混合检索器：分别取向量检索和BM25检索的前fetch_k个结果，按RRF融合后返回前k个文档
+
+    稀疏索引为空（如尚未重新灌库）时只使用向量检索的结果
+    返回文档的元数据中记录融合分数rrf_score，以及向量检索的距离vector_distance和相关度分数relevance_score（余弦相似度，
+    未被向量检索召回时没有这两项）
+    """
+
+    vectorstore: Any
+    # BM25稀疏索引：SparseIndex（本地SQLite文件）或PGSparseIndex（PostgreSQL表）
+    sparse_index: Any
+    k: int = 4
+    fetch_k: int = 20
+    rrf_k: int = 60
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        documents = {}
+        distances = {}
+        # 向量存储的距离换算为余弦相似度，作为相关度分数（越大越相关）
+        relevance_fn = cosine_similarity_fn(self.vectorstore)
+        dense_ranking = []
+        for document, distance in self.vectorstore.similarity_search_with_score(query, k=self.fetch_k):
+            documents[document.id] = document
+            distances[document.id] = distance
+            dense_ranking.append(document.id)
+        sparse_ranking = []
+        for doc_id, text, metadata, _ in self.sparse_index.search(query, self.fetch_k):
+            documents.setdefault(doc_id, Document(page_content=text, metadata=metadata, id=doc_id))
+            sparse_ranking.append(doc_id)
+        fused = reciprocal_rank_fusion([dense_ranking, sparse_ranking], self.rrf_k)[:self.k]
+        logger.info(f"混合检索: 向量召回{len(dense_ranking)}条，BM25召回{len(sparse_ranking)}条，"
+                    f"融合后返回{len(fused)}条，其中仅由BM25召回{sum(1 for doc_id, _ in fused if doc_id not in distances)}条")
+        results = []
+        for doc_id, score in fused:
+            document = documents[doc_id]
+            metadata = dict(document.metadata, rrf_score=score)
+            if doc_id in distances:
+                metadata["vector_distance"] = distances[doc_id]
+                metadata["relevance_score"] = relevance_fn(distances[doc_id])
+            results.append(Document(page_content=document.page_content, metadata=metadata, id=doc_id))
+        return results
+
+    async def _aget_relevant_documents(self, query: str, *,
+                                       run_manager: AsyncCallbackManagerForRetrieverRun) -> List[Document]:
+        # 向量检索、查询嵌入和BM25检索都是阻塞调用，放到线程中执行，避免阻塞事件循环
+        return await asyncio.to_thread(self._get_relevant_documents, query, run_manager=run_manager.get_sync())
+
+
+class ScoredVectorRetriever(BaseRetriever):
+    """向量检索器，返回前k个文档，元数据中记录向量检索的距离vector_distance和相关度分数relevance_score（余弦相似度，越大越相关）"""
+
+    vectorstore: Any
+    k: int = 4
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        relevance_fn = cosine_similarity_fn(self.vectorstore)
+        return [Document(page_content=document.page_content,
+                         metadata=dict(document.metadata, vector_distance=distance, relevance_score=relevance_fn(distance)),
+                         id=document.id)
+                for document, distance in self.vectorstore.similarity_search_with_score(query, k=self.k)]
+
+    async def _aget_relevant_documents(self, query: str, *,
+                                       run_manager: AsyncCallbackManagerForRetrieverRun) -> List[Document]:
+        # 向量检索、查询嵌入和BM25检索都是阻塞调用，放到线程中执行，避免阻塞事件循环
+        return await asyncio.to_thread(self._get_relevant_documents, query, run_manager=run_manager.get_sync())
+
+
+class AdaptiveRetriever(BaseRetriever):
+    """
+    按相关度分数筛选文档的检索器，包装一个在元数据中记录relevance_score的检索器（HybridRetriever或ScoredVectorRetriever）
+
+    按原有排名依次判断，保留满足以下条件的文档：
+    1、相关度分数不低于min_score，且与最高分的差距不超过max_score_gap（分数断崖之后的文档不再返回，简单问题只返回少数几条）
+    2、没有相关度分数的文档（仅由BM25召回）不按分数筛选
+    3、保留的文档不足min_k条时，按排名补足，排名第一的文档始终保留
+    4、文档内容的估算token数累计不超过max_tokens，单个文档超出预算时截断
+    各项参数为None表示不做该项限制
+    """
+
+    retriever: BaseRetriever
+    min_score: Optional[float] = None
+    max_score_gap: Optional[float] = None
+    min_k: int = 1
+    max_tokens: Optional[int] = None
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        candidates = self.retriever.invoke(query, config={"callbacks": run_manager.get_child()})
+        return self._select(candidates)
+
+    async def _aget_relevant_documents(self, query: str, *,
+                                       run_manager: AsyncCallbackManagerForRetrieverRun) -> List[Document]:
+        candidates = await self.retriever.ainvoke(query, config={"callbacks": run_manager.get_child()})
+        return self._select(candidates)
+
+    def _select(self, candidates: List[Document]) -> List[Document]:
+        """按相关度分数和token预算筛选候选文档"""
+        scores = [document.metadata.get("relevance_score") for document in candidates]
+        best = max((score for score in scores if score is not None), default=None)
+        # 排名第一的文档（混合检索时为RRF融合第一，可能是向量分数较低的BM25精确匹配）始终保留
+        selected = [0] if candidates else []
+        for rank, (document, score) in enumerate(zip(candidates, scores)):
+            if rank == 0:
+                continue
+            if score is not None:
+                if self.min_score is not None and score < self.min_score:
+                    continue
+                if self.max_score_gap is not None and best - score > self.max_score_gap:
+                    continue
+            selected.append(rank)
+        # 按排名补足min_k条
+        for rank in range(len(candidates)):
+            if len(selected) >= self.min_k:
+                break
+            if rank not in selected:
+                selected.append(rank)
+        selected.sort()
+        results, used_tokens = apply_token_budget([candidates[rank] for rank in selected], self.max_tokens)
+        logger.info(f"自适应检索: 候选{len(candidates)}条，最高相关度{best}，返回{len(results)}条，约{used_tokens}个token，"
+                    f"各文档相关度{[None if score is None else round(score, 4) for score in scores]}")
+        return results
+
+
+class ContextMergeRetriever(BaseRetriever):
+    """上下文去重检索器，合并被包装检索器返回的文档中同一来源首尾重叠的文本块，并去掉重复的句子"""
+
+    retriever: BaseRetriever
+    min_overlap: int = 20
+    min_sentence_length: Optional[int] = 20
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        documents = self.retriever.invoke(query, config={"callbacks": run_manager.get_child()})
+        return deduplicate_context(documents, self.min_overlap, self.min_sentence_length)
+
+    async def _aget_relevant_documents(self, query: str, *,
+                                       run_manager: AsyncCallbackManagerForRetrieverRun) -> List[Document]:
+        documents = await self.retriever.ainvoke(query, config={"callbacks": run_manager.get_child()})
+        return deduplicate_context(documents, self.min_overlap, self.min_sentence_length)
@@ -0,0 +1,133 @@
+# 功能说明：基于pgvector的语义答案缓存，按用户及知识库版本隔离
+# 问题向量与缓存中的问题足够相似（余弦相似度不低于阈值）时直接返回缓存的答案，跳过agent、检索、评分、生成的整个流程
+# 条目超过有效期后不再命中，每个用户的条目数超过上限时淘汰最久未命中的条目；重新灌库后知识库版本号变化，旧版本的条目全部失效
+import logging
+from typing import Optional
+from langchain_core.embeddings import Embeddings
+
+
+# 设置日志模版
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def _vector_literal(vector) -> str:
+    # pgvector的文本表示，配合 ::vector 类型转换使用，无需额外安装pgvector的Python包
+    return '[' + ','.join(repr(float(x)) for x in vector) + ']'
+
+
+class SemanticAnswerCache:
+    """语义答案缓存，数据存储在PostgreSQL（需pgvector扩展）的semantic_answer_cache表中"""
+
+    def __init__(self, db_connection_pool, embeddings: Embeddings, corpus_version, dims: int = 1536,
+                 threshold: float = 0.95, ttl: int = 24 * 3600, max_entries_per_user: int = 1000):
+        """
+        Args:
+            db_connection_pool: 数据库连接池
+            embeddings (Embeddings): 计算问题向量的模型实例
+            corpus_version: 知识库版本号（FileCorpusVersion或PGCorpusVersion），由灌库脚本更新
+            dims (int): 向量维度
+            threshold (float): 命中所需的最低余弦相似度
+            ttl (int): 条目有效期（秒）
+            max_entries_per_user (int): 每个用户最多保留的条目数
+        """
+        self.db_connection_pool = db_connection_pool
+        self.embeddings = embeddings
+        self.corpus_version = corpus_version
+        self.dims = dims
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries_per_user = max_entries_per_user
+        self._purged_version = None
+        self.hits = 0
+        self.misses = 0
+
+    def setup(self):
+        """创建pgvector扩展、缓存表及索引（HNSW余弦距离索引）"""
+        with self.db_connection_pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("CREATE EXTENSION IF NOT EXISTS vector")
+                cur.execute(f"""
+                    CREATE TABLE IF NOT EXISTS semantic_answer_cache (
+                        id BIGSERIAL PRIMARY KEY,
+                        user_id TEXT NOT NULL,
+                        corpus_version TEXT NOT NULL,
+                        question TEXT NOT NULL,
+                        answer TEXT NOT NULL,
+                        embedding vector({self.dims}) NOT NULL,
+                        created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+                        last_hit_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+                        hits INTEGER DEFAULT 0
+                    )
+                """)
+                cur.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_semantic_answer_cache_user
+                    ON semantic_answer_cache (user_id, corpus_version)
+                """)
+                cur.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_semantic_answer_cache_embedding
+                    ON semantic_answer_cache USING hnsw (embedding vector_cosine_ops)
+                """)
+        logger.info("Semantic answer cache table checked/created.")
+
+    def _current_version(self, cur) -> str:
+        # 知识库版本号变化后，删除旧版本的全部条目
+        version = self.corpus_version.read()
+        if version != self._purged_version:
+            cur.execute("DELETE FROM semantic_answer_cache WHERE corpus_version <> %s", (version,))
+            if cur.rowcount:
+                logger.info(f"知识库版本号变化，清除{cur.rowcount}条旧的语义缓存")
+            self._purged_version = version
+        return version
+
+    def lookup(self, user_id: str, question: str) -> Optional[str]:
+        """
+        查找语义相似的已缓存问题
+
+        Returns:
+            str: 命中时返回缓存的答案，否则返回None
+        """
+        embedding = _vector_literal(self.embeddings.embed_query(question))
+        with self.db_connection_pool.connection() as conn:
+            with conn.cursor() as cur:
+                version = self._current_version(cur)
+                cur.execute("""
+                    SELECT id, question, answer, 1 - (embedding <=> %s::vector) AS similarity
+                    FROM semantic_answer_cache
+                    WHERE user_id = %s AND corpus_version = %s
+                      AND created_at > CURRENT_TIMESTAMP - make_interval(secs => %s)
+                    ORDER BY embedding <=> %s::vector
+                    LIMIT 1
+                """, (embedding, user_id, version, float(self.ttl), embedding))
+                row = cur.fetchone()
+                if row is None or row[3] < self.threshold:
+                    self.misses += 1
+                    logger.info(f"语义缓存未命中，最高相似度: {row[3] if row else None}")
+                    return None
+                cur.execute("""
+                    UPDATE semantic_answer_cache SET last_hit_at = CURRENT_TIMESTAMP, hits = hits + 1 WHERE id = %s
+                """, (row[0],))
+        self.hits += 1
+        logger.info(f"语义缓存命中，相似度{row[3]:.4f}，缓存的问题: {row[1]}")
+        return row[2]
+
+    def store(self, user_id: str, question: str, answer: str):
+        """写入问题及答案，并淘汰该用户超出上限的最久未命中条目"""
+        embedding = _vector_literal(self.embeddings.embed_query(question))
+        with self.db_connection_pool.connection() as conn:
+            with conn.cursor() as cur:
+                version = self._current_version(cur)
+                cur.execute("""
+                    INSERT INTO semantic_answer_cache (user_id, corpus_version, question, answer, embedding)
+                    VALUES (%s, %s, %s, %s, %s::vector)
+                """, (user_id, version, question, answer, embedding))
+                cur.execute("""
+                    DELETE FROM semantic_answer_cache WHERE id IN (
+                        SELECT id FROM semantic_answer_cache WHERE user_id = %s
+                        ORDER BY last_hit_at DESC OFFSET %s
+                    ) OR (user_id = %s AND created_at <= CURRENT_TIMESTAMP - make_interval(secs => %s))
+                """, (user_id, self.max_entries_per_user, user_id, float(self.ttl)))
+
+    def stats(self) -> dict:
+        """返回命中统计"""
+        return {"hits": self.hits, "misses": self.misses}
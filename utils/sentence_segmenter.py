@@ -0,0 +1,128 @@
+# 功能说明：中英文混合文本的断句，按段落检测语言，不依赖NLTK及punkt模型文件
+# 中文按句末标点（。！？；等）断句；英文按句点/问号/感叹号后接空白及大写字母、数字等断句，并排除常见缩写
+import re
+import time
+import logging
+
+
+# 设置日志模版
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+# 中日韩字符
+_CJK = r'\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff'
+_CJK_PATTERN = re.compile(f'[{_CJK}]')
+_LATIN_PATTERN = re.compile(r'[A-Za-z]')
+
+# 句末标点之后可能紧跟的右引号、右括号
+_CLOSERS = r'”’」』）》)\]"\''
+
+# 断句边界，匹配句末标点（含其后的右引号、右括号），边界位于匹配结束处：
+# （1）中文句末标点，任何位置都断句
+# （2）半角问号、感叹号后接空白或文本结束，或后接中日韩字符
+# （3）英文句点后接空白，且下一个字符为大写字母、数字、左引号/括号或中日韩字符
+_BOUNDARY_PATTERN = re.compile(
+    f'[。！？；]+[{_CLOSERS}]*'
+    f'|[!?]+[{_CLOSERS}]*(?=\\s|$|[{_CJK}])'
+    f'|\\.[{_CLOSERS}]*(?=\\s+[A-Z0-9“‘"(\\[{_CJK}])'
+)
+
+# 中文段落中半角问号、感叹号也作为句末标点，无需后接空白；句点后直接接中文时同样断句
+_ZH_BOUNDARY_PATTERN = re.compile(
+    f'[。！？；!?]+[{_CLOSERS}]*'
+    f'|\\.[{_CLOSERS}]*(?=\\s+[A-Z0-9“‘"(\\[]|\\s*[{_CJK}])'
+)
+
+# 句点之前的单词若为常见缩写，则不在此处断句
+_ABBREVIATIONS = frozenset(
+    word.lower() for word in (
+        "mr", "mrs", "ms", "dr", "prof", "sr", "jr", "st", "vs", "etc", "al", "fig", "figs", "eq", "eqs",
+        "sec", "no", "nos", "vol", "pp", "p", "ch", "approx", "dept", "inc", "ltd", "co", "corp",
+        "e.g", "i.e", "cf", "viz", "jan", "feb", "mar", "apr", "jun", "jul", "aug", "sep", "sept",
+        "oct", "nov", "dec", "tab", "ref", "refs", "resp",
+    )
+)
+_PREV_WORD_PATTERN = re.compile(r'([A-Za-z][A-Za-z.]*)$')
+# 列表序号（如 "1." "a." "iv."），不单独成句
+_LIST_MARKER_PATTERN = re.compile(r'\s*(?:\d{1,3}|[A-Za-z]|[ivxIVX]{1,4})\.\s*')
+
+
+def detect_language(text: str) -> str:
+    """
+    检测段落语言：中日韩字符占字母类字符的比例超过30%视为中文
+
+    Returns:
+        str: 'zh' 或 'en'
+    """
+    cjk = len(_CJK_PATTERN.findall(text))
+    if not cjk:
+        return 'en'
+    latin = len(_LATIN_PATTERN.findall(text))
+    # 英文单词平均约5个字母，按单词数与汉字数比较
+    return 'zh' if cjk >= 0.3 * (cjk + latin / 5) else 'en'
+
+
+def _is_abbreviation(text: str, index: int) -> bool:
+    # 判断位置index处的句点是否属于缩写或人名首字母（如 "e.g." "Fig." "J."）
+    match = _PREV_WORD_PATTERN.search(text, 0, index)
+    if not match:
+        return False
+    word = match.group(1).rstrip('.').lower()
+    return word in _ABBREVIATIONS or (len(word) == 1 and word.isalpha() and text[match.start(1)].isupper())
+
+
+def sent_tokenize(text: str, language: str = None):
+    """
+    将段落切分为句子，可作为原中文正则断句及NLTK sent_tokenize的直接替代
+
+    Args:
+        text (str): 段落文本
+        language (str): 'zh' 或 'en'，None表示自动检测
+
+    Returns:
+        list: 句子列表，已去掉空字符串
+    """
+    language = language or detect_language(text)
+    pattern = _ZH_BOUNDARY_PATTERN if language == 'zh' else _BOUNDARY_PATTERN
+    sentences = []
+    start = 0
+    for match in pattern.finditer(text):
+        end = match.end()
+        # 英文句点需排除缩写和列表序号
+        if text[match.start()] == '.' and (_is_abbreviation(text, match.start())
+                                           or _LIST_MARKER_PATTERN.fullmatch(text, start, end)):
+            continue
+        sentences.append(text[start:end])
+        start = end
+    sentences.append(text[start:])
+    # 去掉空字符串
+    return [sentence for sentence in sentences if sentence.strip()]
+
+
+if __name__ == "__main__":
+    # 与原有断句方式对比速度：原中文正则断句、NLTK punkt断句（需已安装NLTK及punkt_tab数据）
+    from utils import pdf_pipeline
+
+    def regex_sent_tokenize(input_string):
+        sentences = re.split(r'(?<=[。！？；?!])', input_string)
+        return [sentence for sentence in sentences if sentence.strip()]
+
+    splitters = {"sentence_segmenter": sent_tokenize, "regex(原中文)": regex_sent_tokenize}
+    try:
+        start = time.perf_counter()
+        from nltk.tokenize import sent_tokenize as nltk_sent_tokenize
+        logger.info(f"NLTK导入耗时: {time.perf_counter() - start:.3f}秒")
+        nltk_sent_tokenize("Warm up.")
+        splitters["nltk(原英文)"] = nltk_sent_tokenize
+    except Exception as e:
+        logger.info(f"跳过NLTK对比: {e}")
+
+    for filename in ["input/健康档案.pdf", "input/deepseek-v3-1-4.pdf"]:
+        lines = pdf_pipeline.iter_lines(pdf_pipeline.iter_pages(filename))
+        paragraphs = [paragraph for _, paragraph in pdf_pipeline.iter_paragraphs(lines, 1)] * 50
+        for name, splitter in splitters.items():
+            start = time.perf_counter()
+            count = sum(len(splitter(paragraph)) for paragraph in paragraphs)
+            elapsed = time.perf_counter() - start
+            logger.info(f"{filename} {name}: {len(paragraphs)}段 -> {count}句，耗时{elapsed * 1000:.1f}毫秒")
@@ -0,0 +1,197 @@
+# 功能说明：进程内的BM25稀疏索引，与chromaDB集合并行维护，弥补向量检索对人名、编号、数值等精确字面匹配的不足
+# 中日韩文本按单字及相邻二字切分，英文单词和数字串整体作为词项；索引持久化在SQLite中，灌库时与向量集合同步增删
+# 查询时在内存中计算BM25分数，其他进程（如灌库脚本）修改索引后自动重新加载
+import os
+import re
+import json
+import math
+import sqlite3
+import logging
+import threading
+from collections import Counter
+from utils.embedding_cache import normalize_text
+
+
+# 设置日志模版
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+# 中日韩字符连续片段，以及英文单词、数字串
+_CJK = r'\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff'
+_TOKEN_PATTERN = re.compile(f'[{_CJK}]+|[a-z0-9]+')
+_CJK_PATTERN = re.compile(f'[{_CJK}]')
+
+
+def tokenize(text: str) -> list:
+    """
+    将文本切分为BM25词项：中日韩字符取单字及相邻二字（字符n-gram），英文单词及数字串整体作为一个词项
+
+    Returns:
+        list: 词项列表（含重复）
+    """
+    terms = []
+    for token in _TOKEN_PATTERN.findall(normalize_text(text).lower()):
+        if _CJK_PATTERN.match(token):
+            terms.extend(token)
+            terms.extend(token[i:i + 2] for i in range(len(token) - 1))
+        else:
+            terms.append(token)
+    return terms
+
+
+class SparseIndex:
+    """
+    BM25稀疏索引，线程安全
+
+    文档以与chromaDB相同的ID存储（含文本和元数据），检索结果可以直接与向量检索结果按ID融合
+    """
+
+    def __init__(self, path: str, k1: float = 1.5, b: float = 0.75):
+        """
+        Args:
+            path (str): SQLite数据库文件路径
+            k1 (float): BM25词频饱和参数
+            b (float): BM25文档长度归一化参数
+        """
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS documents (
+                id TEXT PRIMARY KEY,
+                text TEXT NOT NULL,
+                metadata TEXT NOT NULL,
+                length INTEGER NOT NULL
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL,
+                id TEXT NOT NULL,
+                tf INTEGER NOT NULL,
+                PRIMARY KEY (term, id)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_postings_id ON postings (id)")
+        self._conn.commit()
+        # 内存中的倒排表 {词项: {文档ID: 词频}} 及文档长度，首次检索时加载，索引被修改后重新加载
+        self._postings = None
+        self._lengths = None
+        self._loaded_version = None
+
+    def add_documents(self, ids: list, texts: list, metadatas: list = None):
+        """按ID写入文档，已存在的文档被覆盖"""
+        if not ids:
+            return
+        metadatas = metadatas or [{}] * len(ids)
+        with self._lock:
+            self._delete(ids)
+            rows = []
+            postings = []
+            for doc_id, text, metadata in zip(ids, texts, metadatas):
+                counts = Counter(tokenize(text))
+                rows.append((doc_id, text, json.dumps(metadata or {}, ensure_ascii=False), sum(counts.values())))
+                postings.extend((term, doc_id, tf) for term, tf in counts.items())
+            self._conn.executemany("INSERT INTO documents (id, text, metadata, length) VALUES (?, ?, ?, ?)", rows)
+            self._conn.executemany("INSERT INTO postings (term, id, tf) VALUES (?, ?, ?)", postings)
+            self._conn.commit()
+
+    def delete(self, ids: list):
+        """按ID删除文档"""
+        if not ids:
+            return
+        with self._lock:
+            self._delete(ids)
+            self._conn.commit()
+
+    def _delete(self, ids):
+        # SQLite单条语句的参数个数有上限，分段执行
+        for i in range(0, len(ids), 500):
+            part = list(ids[i:i + 500])
+            placeholders = ','.join('?' * len(part))
+            self._conn.execute(f"DELETE FROM documents WHERE id IN ({placeholders})", part)
+            self._conn.execute(f"DELETE FROM postings WHERE id IN ({placeholders})", part)
+
+    def missing_ids(self, ids: list) -> set:
+        """返回ids中尚未写入索引的ID，用于为已有的向量集合补建索引"""
+        found = set()
+        with self._lock:
+            for i in range(0, len(ids), 500):
+                part = list(ids[i:i + 500])
+                rows = self._conn.execute(
+                    f"SELECT id FROM documents WHERE id IN ({','.join('?' * len(part))})", part
+                ).fetchall()
+                found.update(row[0] for row in rows)
+        return set(ids) - found
+
+    def count(self) -> int:
+        """返回索引中的文档数量"""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def _ensure_loaded(self):
+        # data_version在其他连接（如灌库进程）提交修改后变化，本连接的修改体现在total_changes上，任一变化都重新加载
+        version = (self._conn.execute("PRAGMA data_version").fetchone()[0], self._conn.total_changes)
+        if version == self._loaded_version:
+            return
+        postings = {}
+        for term, doc_id, tf in self._conn.execute("SELECT term, id, tf FROM postings"):
+            postings.setdefault(term, {})[doc_id] = tf
+        self._postings = postings
+        self._lengths = dict(self._conn.execute("SELECT id, length FROM documents"))
+        self._loaded_version = version
+
+    def search(self, query: str, k: int = 10) -> list:
+        """
+        按BM25分数检索文档
+
+        Args:
+            query (str): 查询文本
+            k (int): 返回的文档数量
+
+        Returns:
+            list: [(文档ID, 文本, 元数据, BM25分数)]，按分数从高到低排列
+        """
+        with self._lock:
+            self._ensure_loaded()
+            count = len(self._lengths)
+            if not count:
+                return []
+            average_length = sum(self._lengths.values()) / count
+            scores = Counter()
+            for term, query_tf in Counter(tokenize(query)).items():
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, tf in postings.items():
+                    norm = self.k1 * (1 - self.b + self.b * self._lengths[doc_id] / average_length)
+                    scores[doc_id] += query_tf * idf * tf * (self.k1 + 1) / (tf + norm)
+            top = scores.most_common(k)
+            if not top:
+                return []
+            placeholders = ','.join('?' * len(top))
+            rows = {row[0]: row[1:] for row in self._conn.execute(
+                f"SELECT id, text, metadata FROM documents WHERE id IN ({placeholders})", [doc_id for doc_id, _ in top]
+            )}
+        return [(doc_id, rows[doc_id][0], json.loads(rows[doc_id][1]), score) for doc_id, score in top if doc_id in rows]
+
+
+# 同一路径的索引在进程内共享一个实例
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_sparse_index(path: str) -> SparseIndex:
+    """获取指定路径的稀疏索引实例，同一进程内复用"""
+    with _indexes_lock:
+        if path not in _indexes:
+            _indexes[path] = SparseIndex(path)
+        return _indexes[path]
@@ -2,6 +2,10 @@ from langchain_chroma import Chroma
 from langchain.tools.retriever import create_retriever_tool
 from langchain_core.tools import tool
 from utils.config import Config
+from utils.embedding_cache import LRUQueryEmbeddings
+from utils.retrievers import AdaptiveRetriever, ContextMergeRetriever, HybridRetriever, ScoredVectorRetriever
+from utils.pgvector_store import PGVectorStore, PGSparseIndex, get_connection_pool
+from utils.sparse_index import get_sparse_index
 
 
 def get_tools(llm_embedding):
@@ -15,19 +19,68 @@ def get_tools(llm_embedding):
         list: 工具列表
     """
 
-    # 创建 Chroma 向量存储实例
-    vectorstore = Chroma(
-        persist_directory=Config.CHROMADB_DIRECTORY,
-        collection_name=Config.CHROMADB_COLLECTION_NAME,
-        embedding_function=llm_embedding,
+    # 查询向量加上进程内LRU缓存，重复的问题及改写后回到检索的问题不再访问向量接口
+    query_embedding = LRUQueryEmbeddings(
+        llm_embedding,
+        max_size=Config.QUERY_EMBEDDING_CACHE_SIZE,
+        ttl=Config.QUERY_EMBEDDING_CACHE_TTL,
     )
-    # 将向量存储转换为检索器
-    retriever = vectorstore.as_retriever()
+    # 创建向量存储实例：pgvector表（多个服务实例共用）或本地 Chroma 目录
+    if Config.RETRIEVER_BACKEND == "pgvector":
+        vectorstore = PGVectorStore(
+            get_connection_pool(Config.PGVECTOR_DB_URI),
+            Config.CHROMADB_COLLECTION_NAME,
+            query_embedding,
+            hnsw_m=Config.PGVECTOR_HNSW_M,
+            hnsw_ef_construction=Config.PGVECTOR_HNSW_EF_CONSTRUCTION,
+            ef_search=Config.PGVECTOR_EF_SEARCH,
+        )
+    else:
+        vectorstore = Chroma(
+            persist_directory=Config.CHROMADB_DIRECTORY,
+            collection_name=Config.CHROMADB_COLLECTION_NAME,
+            embedding_function=query_embedding,
+            # 集合尚不存在时按余弦距离创建，与灌库脚本一致；已有集合保持创建时的距离类型
+            collection_metadata={"hnsw:space": "cosine"},
+        )
+    # 将向量存储转换为检索器，开启混合检索时与BM25稀疏索引的结果按RRF融合
+    # 稀疏索引与向量库存储在一起：pgvector后端存储在同一数据库中，chroma后端为本地SQLite文件
+    if Config.HYBRID_SEARCH:
+        if Config.RETRIEVER_BACKEND == "pgvector":
+            sparse_index = PGSparseIndex(get_connection_pool(Config.PGVECTOR_DB_URI), Config.CHROMADB_COLLECTION_NAME)
+        else:
+            sparse_index = get_sparse_index(Config.SPARSE_INDEX_PATH)
+        retriever = HybridRetriever(
+            vectorstore=vectorstore,
+            sparse_index=sparse_index,
+            k=Config.RETRIEVER_TOP_K,
+            fetch_k=Config.HYBRID_FETCH_K,
+            rrf_k=Config.RRF_K,
+        )
+    else:
+        retriever = ScoredVectorRetriever(vectorstore=vectorstore, k=Config.RETRIEVER_TOP_K)
+    # 按相关度分数筛选检索结果：低于阈值或分数断崖之后的文档不再返回，返回内容不超过token预算
+    retriever = AdaptiveRetriever(
+        retriever=retriever,
+        min_score=Config.RETRIEVER_MIN_SCORE,
+        max_score_gap=Config.RETRIEVER_MAX_SCORE_GAP,
+        min_k=Config.RETRIEVER_MIN_K,
+        max_tokens=Config.RETRIEVER_MAX_CONTEXT_TOKENS,
+    )
+    # 合并首尾重叠的文本块并去掉重复的句子，重叠部分不再在评分和生成时重复发送
+    if Config.CONTEXT_DEDUP:
+        retriever = ContextMergeRetriever(
+            retriever=retriever,
+            min_overlap=Config.CONTEXT_DEDUP_MIN_OVERLAP,
+            min_sentence_length=Config.CONTEXT_DEDUP_MIN_SENTENCE_LENGTH,
+        )
     # 创建检索工具
+    # 检索工具以content_and_artifact格式返回，工具消息的artifact中保留逐条文档，供评分节点逐条评分
     retriever_tool = create_retriever_tool(
         retriever,
         name="retrieve",
-        description="这是健康档案查询工具，搜索并返回有关用户的健康档案信息。"
+        description="这是健康档案查询工具，搜索并返回有关用户的健康档案信息。",
+        response_format="content_and_artifact"
     )
 
 